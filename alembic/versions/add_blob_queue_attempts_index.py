@@ -0,0 +1,35 @@
+"""Order expired blob queue by attempts
+
+Revision ID: add_blob_queue_attempts_index
+Revises: add_paste_inline_content
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_blob_queue_attempts_index'
+down_revision: Union[str, Sequence[str], None] = 'add_paste_inline_content'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Очередь выбирается по (attempts, queued_at): неудачные файлы не блокируют новые
+    op.execute("UPDATE expired_blob_queue SET attempts = 0 WHERE attempts IS NULL")
+    op.alter_column('expired_blob_queue', 'attempts', existing_type=sa.Integer(),
+                    nullable=False, server_default='0')
+    op.drop_index('idx_expired_blob_queue_queued_at', table_name='expired_blob_queue')
+    op.create_index('idx_expired_blob_queue_attempts', 'expired_blob_queue', ['attempts', 'queued_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_expired_blob_queue_attempts', table_name='expired_blob_queue')
+    op.create_index('idx_expired_blob_queue_queued_at', 'expired_blob_queue', ['queued_at'])
+    op.alter_column('expired_blob_queue', 'attempts', existing_type=sa.Integer(),
+                    nullable=True, server_default=None)
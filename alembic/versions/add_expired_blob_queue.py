@@ -0,0 +1,36 @@
+"""Add expired blob queue for chunked expiry
+
+Revision ID: add_expired_blob_queue
+Revises: add_recent_keyset_index
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_expired_blob_queue'
+down_revision: Union[str, Sequence[str], None] = 'add_recent_keyset_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Очередь файлов, которые нужно удалить из хранилища после удаления паст
+    op.create_table('expired_blob_queue',
+        sa.Column('paste_id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('queued_at', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('paste_id')
+    )
+    op.create_index('idx_expired_blob_queue_queued_at', 'expired_blob_queue', ['queued_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_expired_blob_queue_queued_at', table_name='expired_blob_queue')
+    op.drop_table('expired_blob_queue')
@@ -0,0 +1,29 @@
+"""Add inline content column for small pastes
+
+Revision ID: add_paste_inline_content
+Revises: add_paste_preview
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_paste_inline_content'
+down_revision: Union[str, Sequence[str], None] = 'add_paste_preview'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Содержимое небольших паст (существующие пасты остаются в хранилище, content = NULL)
+    op.add_column('pastes', sa.Column('content', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Перед откатом содержимое inline-паст нужно перенести в хранилище
+    op.drop_column('pastes', 'content')
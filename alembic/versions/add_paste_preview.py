@@ -0,0 +1,32 @@
+"""Add stored preview fields to pastes
+
+Revision ID: add_paste_preview
+Revises: add_paste_search_vector
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_paste_preview'
+down_revision: Union[str, Sequence[str], None] = 'add_paste_search_vector'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Превью для списков паст (для существующих паст - backfill_previews() при старте приложения)
+    op.add_column('pastes', sa.Column('preview', sa.Text(), nullable=True))
+    op.add_column('pastes', sa.Column('line_count', sa.Integer(), nullable=True))
+    op.add_column('pastes', sa.Column('size_bytes', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('pastes', 'size_bytes')
+    op.drop_column('pastes', 'line_count')
+    op.drop_column('pastes', 'preview')
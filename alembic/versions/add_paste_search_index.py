@@ -0,0 +1,44 @@
+"""Add trigram search index for pastes
+
+Revision ID: add_paste_search_index
+Revises: simple_add_secret_key
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_paste_search_index'
+down_revision: Union[str, Sequence[str], None] = 'simple_add_secret_key'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Расширение для триграммного поиска по подстроке
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    
+    # Таблица поискового индекса (название + содержимое пасты)
+    op.create_table('paste_search_index',
+        sa.Column('paste_id', sa.Integer(), nullable=False),
+        sa.Column('document', sa.Text(), nullable=False),
+        sa.Column('indexed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['paste_id'], ['pastes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('paste_id')
+    )
+    
+    # GIN-индекс для ILIKE '%...%'
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_paste_search_document_trgm
+        ON paste_search_index USING gin (document gin_trgm_ops);
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_paste_search_document_trgm;")
+    op.drop_table('paste_search_index')
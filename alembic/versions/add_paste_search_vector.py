@@ -0,0 +1,37 @@
+"""Add full-text search vector to paste search index
+
+Revision ID: add_paste_search_vector
+Revises: add_expired_blob_queue
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_paste_search_vector'
+down_revision: Union[str, Sequence[str], None] = 'add_expired_blob_queue'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # tsvector из названия и начала содержимого (заполняется при создании пасты,
+    # для существующих строк - backfill_search_vectors() при старте приложения)
+    op.add_column('paste_search_index', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    
+    # GIN-индекс для websearch_to_tsquery / @@
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_paste_search_vector
+        ON paste_search_index USING gin (search_vector);
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_paste_search_vector;")
+    op.drop_column('paste_search_index', 'search_vector')
@@ -0,0 +1,27 @@
+"""Add title prefix index for short search queries
+
+Revision ID: add_paste_title_prefix_index
+Revises: add_blob_queue_attempts_index
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_paste_title_prefix_index'
+down_revision: Union[str, Sequence[str], None] = 'add_blob_queue_attempts_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Запросы из слов короче трех символов ищутся по началу названия (триграммы для них не извлекаются)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_pastes_title_prefix ON pastes (lower(title) text_pattern_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_pastes_title_prefix")
@@ -0,0 +1,40 @@
+"""Add keyset pagination indexes for recent pastes
+
+Revision ID: add_recent_keyset_index
+Revises: add_paste_search_index
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_recent_keyset_index'
+down_revision: Union[str, Sequence[str], None] = 'add_paste_search_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Индекс под ORDER BY created_at DESC, id DESC для публичных активных паст
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pastes_public_recent_keyset
+        ON pastes (created_at DESC, id DESC)
+        WHERE is_expired = false AND is_private = false;
+    """)
+    
+    # То же самое с фильтром по категории
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pastes_public_language_keyset
+        ON pastes (language, created_at DESC, id DESC)
+        WHERE is_expired = false AND is_private = false;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_pastes_public_language_keyset;")
+    op.execute("DROP INDEX IF EXISTS idx_pastes_public_recent_keyset;")
@@ -1,20 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, send_file, Response, stream_with_context, session
 import json
 import os
 import hashlib
 from datetime import datetime, timedelta, timezone
-import threading
 import time
 from llm_helper import OllamaHelper
 import re
 import qrcode
 import io
 import base64
+from werkzeug.exceptions import HTTPException
 
 # Импорты для новой архитектуры
 from models import db, Paste, User, Tag, AppStats
 from storage_simple import FileStorage
+from content_cache import CachedStorage
+import compression
 from config import get_config
+from search_index import (ensure_search_index, index_paste, search_paste_page, search_paste_page_fts,
+                          rebuild_search_index, backfill_search_vectors, SEARCH_MODES)
+from pagination import keyset_page, parse_page_size
+from view_counter import ViewCounter
+from expiry import ExpiryEngine, ExpiryWorker, notify_expiry
+from db_routing import replica_router, read_only, mark_write
+from previews import apply_preview, backfill_previews
+from facets import get_category_facets, invalidate_category_facets, category_list
+from page_cache import PageCache
+from cache_invalidation import CacheInvalidationListener, notify_public_pages_changed
+from storage_tiered import TieredStorage
+from stats import record_paste_created, record_paste_deleted, get_page_stats, reconcile_stats
 
 app = Flask(__name__)
 
@@ -24,8 +38,132 @@ app.config.from_object(get_config())
 # Инициализация расширений
 db.init_app(app)
 
-# Инициализация файлового хранилища
-storage = FileStorage()
+# Реплики для чтения (если заданы DATABASE_REPLICA_URLS)
+replica_router.init_app(app)
+
+def create_storage_backend():
+    """Хранилище содержимого по STORAGE_BACKEND: file, minio или tiered (MinIO + локальный кэш)"""
+    backend = app.config['STORAGE_BACKEND']
+    if backend in ('minio', 'tiered'):
+        # minio - необязательная зависимость, импортируется только при использовании
+        from storage import MinioStorage
+        remote = MinioStorage()
+        if backend == 'minio':
+            return remote
+        return TieredStorage(
+            remote,
+            cache_dir=app.config['TIERED_CACHE_DIR'],
+            max_bytes=app.config['TIERED_CACHE_MAX_BYTES']
+        )
+    
+    return FileStorage(
+        app.config['UPLOAD_FOLDER'],
+        dedup=app.config['STORAGE_DEDUP'],
+        codec=app.config['STORAGE_COMPRESSION'],
+        compress_min_bytes=app.config['COMPRESSION_MIN_BYTES']
+    )
+
+# Инициализация хранилища (с LRU-кэшем содержимого в памяти воркера)
+storage = CachedStorage(
+    create_storage_backend(),
+    max_bytes=app.config['CONTENT_CACHE_MAX_BYTES']
+)
+
+# Кэш готового HTML главной и первой страницы /recent
+page_cache = PageCache(ttl=app.config['PAGE_CACHE_TTL'])
+
+def public_pages_changed():
+    """Сбрасывает кэши, зависящие от набора публичных паст (в текущем воркере)
+
+    Остальные воркеры сбрасывают те же кэши по уведомлению: транзакция, меняющая
+    набор публичных паст, вызывает notify_public_pages_changed() до commit.
+    """
+    invalidate_category_facets()
+    page_cache.invalidate()
+
+# Сброс кэша страниц и фасета категорий по уведомлениям из других воркеров и реплик
+cache_invalidation = CacheInvalidationListener(app, on_change=public_pages_changed)
+if app.config['CACHE_INVALIDATION_ENABLED']:
+    cache_invalidation.start()
+
+def has_pending_flashes():
+    """Есть ли у пользователя непоказанные flash-сообщения (такие страницы не кэшируются)"""
+    return bool(session.get('_flashes'))
+
+def cached_page(key, render):
+    """Отдает страницу из кэша или рендерит и сохраняет ее (если нет flash-сообщений)
+
+    render() возвращает (html, сроки жизни показанных паст) или (html, None),
+    если страницу кэшировать нельзя (например, при ошибке загрузки).
+    Кэш общий для всех хостов, поэтому страница не должна содержать
+    абсолютных ссылок (url_for(..., _external=True)).
+    """
+    if has_pending_flashes():
+        return render()[0]
+    html = page_cache.get(key)
+    if html is not None:
+        response = make_response(html)
+        response.headers['X-Page-Cache'] = 'HIT'
+        return response
+    generation = page_cache.generation
+    html, expires_at_values = render()
+    if expires_at_values is not None:
+        page_cache.put(key, html, expires_at_values, generation=generation)
+    response = make_response(html)
+    response.headers['X-Page-Cache'] = 'MISS'
+    return response
+
+# Буферизованный счетчик просмотров (вместо commit на каждый просмотр)
+view_counter = ViewCounter(
+    app,
+    flush_interval=app.config['VIEW_FLUSH_INTERVAL'],
+    max_pending=app.config['VIEW_FLUSH_MAX_PENDING']
+)
+
+# Порционное удаление истекших паст (файлы удаляются через очередь expired_blob_queue)
+expiry_engine = ExpiryEngine(
+    storage,
+    chunk_size=app.config['EXPIRY_CHUNK_SIZE'],
+    on_deleted=public_pages_changed
+)
+
+def run_maintenance() -> dict:
+    """Досчитывает данные, появившиеся в новых версиях схемы, для существующих паст
+
+    Выполняется лидером очистки при получении лидерства (под gunicorn блок
+    __main__ не выполняется) и при запуске через python app.py.
+    """
+    result = {
+        'indexed': rebuild_search_index(storage),
+        'search_vectors': backfill_search_vectors(),
+        'previews': backfill_previews(storage)
+    }
+    if any(result.values()):
+        print(f"Обслуживание: проиндексировано {result['indexed']}, векторов {result['search_vectors']}, "
+              f"превью {result['previews']}")
+    return result
+
+# Фоновая очистка: поток есть в каждом воркере gunicorn, но работает только лидер
+# (advisory-блокировка Postgres), поэтому очистка выполняется один раз на все реплики
+expiry_worker = ExpiryWorker(
+    app,
+    expiry_engine,
+    interval=app.config['EXPIRY_INTERVAL'],
+    retry_interval=app.config['EXPIRY_LEADER_RETRY'],
+    reconcile_interval=app.config['STATS_RECONCILE_INTERVAL'],
+    heap_size=app.config['EXPIRY_HEAP_SIZE'],
+    on_leadership=run_maintenance
+)
+if app.config['EXPIRY_WORKER_ENABLED']:
+    expiry_worker.start()
+
+@app.before_request
+def ensure_expiry_worker():
+    """Перезапускает потоки очистки и сброса кэшей в процессе, созданном fork после импорта (gunicorn --preload)"""
+    if app.config['EXPIRY_WORKER_ENABLED']:
+        expiry_worker.start()
+    if app.config['CACHE_INVALIDATION_ENABLED']:
+        cache_invalidation.start()
 
 # Инициализация AI-помощника (может быть отключён через AI_ENABLED)
 ai_helper = None
@@ -47,137 +185,63 @@ def nl2br_filter(text):
         return ''
     return text.replace('\n', '<br>')
 
-def cleanup_expired_pastes():
-    """Удаляет истекшие пасты из БД и MinIO"""
-    while True:
-        try:
-            with app.app_context():
-                # Находим истекшие пасты (не помеченные как истекшие)
-                expired_pastes = Paste.query.filter(
-                    Paste.expires_at < datetime.now(timezone.utc),
-                    Paste.is_expired == False
-                ).all()
-                
-                # Также находим пасты, помеченные как истекшие более 24 часов назад
-                old_expired_pastes = Paste.query.filter(
-                    Paste.is_expired == True,
-                    Paste.expires_at < datetime.now(timezone.utc) - timedelta(hours=24)
-                ).all()
-                
-                # Объединяем списки для удаления
-                pastes_to_delete = expired_pastes + old_expired_pastes
-                
-                deleted_count = 0
-                for paste in pastes_to_delete:
-                    try:
-                        # Удаляем содержимое из MinIO
-                        storage.delete_paste_content(paste.id, paste.content_hash)
-                        
-                        # Удаляем метаданные из MinIO
-                        try:
-                            storage.delete_paste_metadata(paste.id)
-                        except:
-                            pass  # Игнорируем ошибки при удалении метаданных
-                        
-                        # Удаляем пасту из БД
-                        db.session.delete(paste)
-                        deleted_count += 1
-                        
-                    except Exception as e:
-                        print(f"Ошибка при удалении пасты {paste.id}: {e}")
-                        # Если не удалось удалить, помечаем как истекшую
-                        paste.is_expired = True
-                
-                if pastes_to_delete:
-                    try:
-                        db.session.commit()
-                        print(f"✅ Удалено {deleted_count} истекших паст, {len(pastes_to_delete) - deleted_count} помечено как истекшие")
-                    except Exception as e:
-                        db.session.rollback()
-                        print(f"❌ Ошибка при сохранении в БД: {e}")
-                
-            time.sleep(60)  # Проверяем каждую минуту
-            
-        except Exception as e:
-            print(f"❌ Ошибка при очистке паст: {e}")
-            time.sleep(60)
-
-# Запуск потока очистки в фоне (только при запуске приложения)
-cleanup_thread = None
-
-def get_or_create_stat(key, default_value=0):
-    """Получает или создает статистику по ключу"""
-    stat = AppStats.query.filter_by(key=key).first()
-    if not stat:
-        stat = AppStats(key=key, value=default_value)
-        db.session.add(stat)
-        db.session.commit()
-    return stat
+@app.template_filter('filesize')
+def filesize_filter(size):
+    """Размер в байтах в читаемом виде"""
+    if size is None:
+        return ''
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size < 1024 or unit == 'МБ':
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
 
-def increment_stat(key, increment=1):
-    """Увеличивает статистику по ключу"""
-    stat = get_or_create_stat(key)
-    stat.value += increment
-    stat.updated_at = datetime.now(timezone.utc)
-    db.session.commit()
-    return stat.value
+def get_search_mode():
+    """Режим поиска из параметра mode (substring - подстрока, fts - полнотекстовый)"""
+    mode = request.args.get('mode', '').strip().lower()
+    return mode if mode in SEARCH_MODES else app.config['SEARCH_MODE']
 
-def get_stat(key, default_value=0):
-    """Получает значение статистики по ключу"""
-    stat = AppStats.query.filter_by(key=key).first()
-    return stat.value if stat else default_value
+def get_paste_page(search_query, category_filter, cursor, page_size, search_mode='substring'):
+    """Возвращает (страница публичных активных паст, курсор следующей страницы)"""
+    if search_query:
+        # Поиск через поисковый индекс, порядок - по релевантности
+        search = search_paste_page_fts if search_mode == 'fts' else search_paste_page
+        paste_ids, next_cursor = search(search_query, category_filter, cursor, page_size)
+        found_pastes = Paste.query.filter(Paste.id.in_(paste_ids)).all() if paste_ids else []
+        pastes_by_id = {paste.id: paste for paste in found_pastes}
+        return [pastes_by_id[paste_id] for paste_id in paste_ids if paste_id in pastes_by_id], next_cursor
+    
+    # Без поиска - от новых к старым по (created_at, id)
+    query = Paste.query.filter(Paste.not_expired_condition(), Paste.is_private == False)
+    if category_filter:
+        query = query.filter(Paste.language == category_filter)
+    
+    return keyset_page(
+        query, [Paste.created_at, Paste.id], cursor, page_size,
+        key_getter=lambda paste: [paste.created_at, paste.id]
+    )
 
 @app.route('/')
+@read_only
 def index():
-    """Главная страница"""
+    """Главная страница (готовый HTML кэшируется на PAGE_CACHE_TTL секунд)"""
+    return cached_page('index', render_index)
+
+def render_index():
+    """Рендерит главную страницу: (html, сроки жизни показанных паст)"""
     try:
-        # Получаем недавние пасты из БД (только публичные и не истекшие)
-        recent_pastes = Paste.query.filter_by(is_expired=False, is_private=False).order_by(
-            Paste.created_at.desc()
-        ).limit(5).all()
-        
-        # Проверяем истечение паст и обновляем их статус
-        expired_pastes_ids = []
-        for paste in recent_pastes:
-            if paste.expires_at and paste.expires_at < datetime.now(timezone.utc):
-                paste.is_expired = True
-                expired_pastes_ids.append(paste.id)
-        
-        # Сохраняем изменения в БД если есть истекшие пасты
-        if expired_pastes_ids:
-            db.session.commit()
-            print(f"Пасты {expired_pastes_ids} помечены как истекшие на главной странице")
-        
-        # Загружаем содержимое для каждой пасты
-        for paste in recent_pastes:
-            try:
-                paste.content = storage.get_paste_content(paste.id, paste.content_hash)
-                if paste.content is None:
-                    paste.content = "Ошибка загрузки содержимого"
-            except Exception as e:
-                print(f"Ошибка при загрузке содержимого пасты {paste.id}: {e}")
-                paste.content = "Ошибка загрузки содержимого"
-        
-        # Получаем статистику для главной страницы (только публичные пасты)
-        total_pastes_ever = get_stat('total_pastes_ever')  # Общее количество паст за все время
-        active_pastes = Paste.query.filter_by(is_expired=False, is_private=False).count()
-        expired_pastes = Paste.query.filter_by(is_expired=True, is_private=False).count()
-        
-        # Пасты за последние 7 дней (только публичные)
-        week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        pastes_this_week = Paste.query.filter(
-            Paste.created_at >= week_ago,
+        # Получаем недавние пасты из БД (только публичные и не истекшие, срок проверяется в запросе)
+        recent_pastes = Paste.query.filter(
+            Paste.not_expired_condition(),
             Paste.is_private == False
-        ).count()
+        ).order_by(Paste.created_at.desc()).limit(5).all()
+        
+        # Содержимое не загружается: шаблон показывает сохраненное превью (paste.preview)
         
-        stats = {
-            'total_pastes': total_pastes_ever,  # Используем общий счетчик
-            'active_pastes': active_pastes,
-            'expired_pastes': expired_pastes,
-            'pastes_this_week': pastes_this_week
-        }
+        # Получаем статистику для главной страницы (только публичные пасты) из app_stats
+        stats = get_page_stats(app.config['STATS_SNAPSHOT_TTL'])
         
-        return render_template('index.html', recent_pastes=recent_pastes, stats=stats)
+        html = render_template('index.html', recent_pastes=recent_pastes, stats=stats)
+        return html, [paste.expires_at for paste in recent_pastes]
     except Exception as e:
         print(f"Ошибка при загрузке главной страницы: {e}")
         return render_template('index.html', recent_pastes=[], stats={
@@ -185,7 +249,7 @@ def index():
             'active_pastes': 0,
             'expired_pastes': 0,
             'pastes_this_week': 0
-        })
+        }), None
 
 @app.route('/create', methods=['GET', 'POST'])
 def create_paste():
@@ -202,9 +266,11 @@ def create_paste():
             flash('Заполните все обязательные поля', 'error')
             return redirect(url_for('create_paste'))
         
+        stored_blob = None
         try:
             # Сначала создаем hash содержимого
-            content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            content_bytes = content.encode('utf-8')
+            content_hash = hashlib.sha256(content_bytes).hexdigest()
             
             # Создаем новую пасту в БД с уже известным hash
             new_paste = Paste(
@@ -227,28 +293,40 @@ def create_paste():
             if lifetime > 0:
                 new_paste.expires_at = datetime.now(timezone.utc) + timedelta(minutes=lifetime)
             
-            # Сохраняем в БД
+            # Небольшие пасты хранятся прямо в строке БД
+            is_inline = len(content_bytes) < app.config['INLINE_CONTENT_MAX_BYTES']
+            if is_inline:
+                new_paste.content = content
+            
+            # Превью для списков паст - до INSERT, чтобы строка записалась одним запросом
+            apply_preview(new_paste, content)
+            
+            # Сохраняем в БД (INSERT в открытой транзакции выдает id пасты)
             db.session.add(new_paste)
             db.session.flush()
             
-            # Сохраняем содержимое в MinIO
-            storage.save_paste_content(new_paste.id, content)
+            # Содержимое больших паст - единственная запись в хранилище (имя файла зависит от id).
+            # Метаданные в хранилище не пишутся: их источник - строка pastes
+            if not is_inline:
+                storage.save_paste_content(new_paste.id, content)
+                stored_blob = (new_paste.id, content_hash)
             
-            # Сохраняем метаданные в MinIO
-            metadata = {
-                'title': title,
-                'language': language,
-                'lifetime': lifetime,
-                'is_private': is_private,
-                'created_at': new_paste.created_at.isoformat()
-            }
-            storage.save_paste_metadata(new_paste.id, metadata)
+            # Поисковый индекс и статистика (в той же транзакции)
+            index_paste(new_paste, content)
+            record_paste_created(new_paste)
             
-            # Финализируем сохранение
-            db.session.commit()
+            # Лидер очистки получит дедлайн после commit и проснется к нему
+            notify_expiry(new_paste.id, new_paste.expires_at)
+            if not is_private:
+                notify_public_pages_changed()
             
-            # Увеличиваем счетчик общего количества паст
-            increment_stat('total_pastes_ever')
+            # Единственный commit: паста, индекс, счетчики и уведомление фиксируются вместе
+            db.session.commit()
+            # Паста зафиксирована - ее содержимое больше не сирота, даже если дальше что-то упадет
+            stored_blob = None
+            mark_write()
+            if not is_private:
+                public_pages_changed()
             
             if is_private:
                 # Для приватных паст показываем секретную ссылку
@@ -261,53 +339,124 @@ def create_paste():
             
         except Exception as e:
             db.session.rollback()
+            if stored_blob is not None:
+                discard_orphan_blob(*stored_blob)
             print(f"Ошибка при создании пасты: {e}")
             flash(f'Ошибка при создании пасты: {e}', 'error')
             return redirect(url_for('create_paste'))
     
     return render_template('create.html')
 
+def discard_orphan_blob(paste_id, content_hash):
+    """Удаляет содержимое пасты, транзакция которой откатилась (строки в БД для него нет)"""
+    try:
+        storage.delete_paste_content(paste_id, content_hash)
+    except Exception as e:
+        # id из последовательности не переиспользуется, поэтому оставшийся файл недостижим
+        print(f"Не удалось удалить содержимое откаченной пасты {paste_id}: {e}")
+
+def count_paste_view(paste):
+    """Учитывает просмотр пасты в буферизованном счетчике"""
+    view_counter.record(paste.id)
+    if app.config['VIEW_READ_YOUR_VIEWS']:
+        view_counter.apply_pending(paste)
+
+def paste_page_etag(paste):
+    """Слабый ETag страницы пасты: содержимое неизменно, меняется только срок жизни"""
+    expires_part = int(paste.expires_at.timestamp()) if paste.expires_at else 0
+    return f"{paste.content_hash}-{expires_part}"
+
+def paste_page_not_modified(paste, etag):
+    """Проверяет валидаторы запроса (If-None-Match, затем If-Modified-Since)"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and paste.created_at:
+        created_at = paste.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return created_at.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def set_paste_cache_headers(response, paste, etag):
+    """Выставляет валидаторы и Cache-Control для страницы пасты"""
+    response.set_etag(etag, weak=True)
+    if paste.created_at:
+        response.last_modified = paste.created_at
+    
+    if paste.is_private:
+        # Секретные ссылки не должны оседать в общих кэшах, браузер перепроверяет по ETag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    max_age = app.config['PASTE_CACHE_MAX_AGE']
+    remaining_minutes = paste.get_remaining_time()
+    if remaining_minutes is not None:
+        max_age = min(max_age, int(remaining_minutes * 60))
+    response.headers['Cache-Control'] = f'public, max-age={max(max_age, 0)}'
+    return response
+
+def paste_with_content():
+    """Запрос пасты вместе с inline-содержимым (страница небольшой пасты - один запрос к БД)"""
+    return Paste.query.options(db.undefer(Paste.content))
+
+def load_paste_content(paste):
+    """Содержимое пасты: из строки БД для небольших паст, иначе из хранилища"""
+    if paste.content is not None:
+        return paste.content
+    return storage.get_paste_content(paste.id, paste.content_hash)
+
+def paste_page_response(paste, render):
+    """Ответ страницы пасты с поддержкой условных запросов
+
+    304 возвращается до чтения хранилища. Если у пользователя есть
+    flash-сообщения, страница персональная: не кэшируем и не отвечаем 304.
+    """
+    etag = paste_page_etag(paste)
+    has_flashes = has_pending_flashes()
+    
+    if not has_flashes and paste_page_not_modified(paste, etag):
+        count_paste_view(paste)
+        return set_paste_cache_headers(make_response('', 304), paste, etag)
+    
+    response = make_response(render())
+    if has_flashes:
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return set_paste_cache_headers(response, paste, etag)
+
 @app.route('/paste/<int:paste_id>')
 def view_paste(paste_id):
     """Страница просмотра пасты"""
     try:
         # Получаем пасту из БД
-        paste = Paste.query.get_or_404(paste_id)
+        paste = paste_with_content().get_or_404(paste_id)
         
         # Проверяем, не является ли паста приватной
         if paste.is_private:
             flash('Эта паста является приватной и доступна только по секретной ссылке', 'error')
             return redirect(url_for('index'))
         
-        # Проверяем, не истекла ли паста
-        if paste.expires_at and paste.expires_at < datetime.now(timezone.utc):
-            # Помечаем как истекшую если еще не помечена
-            if not paste.is_expired:
-                paste.is_expired = True
-                db.session.commit()
-                print(f"Паста {paste_id} помечена как истекшая при попытке просмотра")
-            
+        # Проверяем, не истекла ли паста (без записи в БД - истекшие пасты удаляет фоновая очистка)
+        if paste.has_expired():
             flash('Паста истекла', 'error')
             return redirect(url_for('index'))
         
-        if paste.is_expired:
-            flash('Паста истекла', 'error')
-            return redirect(url_for('index'))
-        
-        # Получаем содержимое из MinIO
-        try:
-            content = storage.get_paste_content(paste.id, paste.content_hash)
-            if content is None:
+        def render():
+            # Содержимое из строки БД или из хранилища
+            try:
+                content = load_paste_content(paste)
+                if content is None:
+                    content = "Ошибка загрузки содержимого"
+            except Exception as e:
+                print(f"Ошибка при загрузке содержимого из MinIO: {e}")
                 content = "Ошибка загрузки содержимого"
-        except Exception as e:
-            print(f"Ошибка при загрузке содержимого из MinIO: {e}")
-            content = "Ошибка загрузки содержимого"
-        
-        # Увеличиваем счетчик просмотров
-        paste.views_count += 1
-        db.session.commit()
+            
+            # Увеличиваем счетчик просмотров (запись в БД - пакетно, в фоне)
+            count_paste_view(paste)
+            
+            return render_template('view.html', paste=paste, content=content)
         
-        return render_template('view.html', paste=paste, content=content)
+        return paste_page_response(paste, render)
         
     except Exception as e:
         print(f"Ошибка при просмотре пасты: {e}")
@@ -319,63 +468,168 @@ def view_secret_paste(secret_key):
     """Страница просмотра приватной пасты по секретному ключу"""
     try:
         # Получаем пасту по секретному ключу
-        paste = Paste.query.filter_by(secret_key=secret_key, is_private=True).first()
+        paste = paste_with_content().filter_by(secret_key=secret_key, is_private=True).first()
         
         if not paste:
             flash('Приватная паста не найдена или ключ неверный', 'error')
             return redirect(url_for('index'))
         
-        # Проверяем, не истекла ли паста
-        if paste.expires_at and paste.expires_at < datetime.now(timezone.utc):
-            # Помечаем как истекшую если еще не помечена
-            if not paste.is_expired:
-                paste.is_expired = True
-                db.session.commit()
-                print(f"Приватная паста {paste.id} помечена как истекшая при попытке просмотра")
-            
+        # Проверяем, не истекла ли паста (без записи в БД - истекшие пасты удаляет фоновая очистка)
+        if paste.has_expired():
             flash('Приватная паста истекла', 'error')
             return redirect(url_for('index'))
         
-        if paste.is_expired:
-            flash('Приватная паста истекла', 'error')
-            return redirect(url_for('index'))
-        
-        # Получаем содержимое из MinIO
-        try:
-            content = storage.get_paste_content(paste.id, paste.content_hash)
-            if content is None:
+        def render():
+            # Содержимое из строки БД или из хранилища
+            try:
+                content = load_paste_content(paste)
+                if content is None:
+                    content = "Ошибка загрузки содержимого"
+            except Exception as e:
+                print(f"Ошибка при загрузке содержимого приватной пасты {paste.id}: {e}")
                 content = "Ошибка загрузки содержимого"
-        except Exception as e:
-            print(f"Ошибка при загрузке содержимого приватной пасты {paste.id}: {e}")
-            content = "Ошибка загрузки содержимого"
-        
-        # Увеличиваем счетчик просмотров
-        paste.views_count += 1
-        db.session.commit()
+            
+            # Увеличиваем счетчик просмотров (запись в БД - пакетно, в фоне)
+            count_paste_view(paste)
+            
+            return render_template('view.html', paste=paste, content=content)
         
-        return render_template('view.html', paste=paste, content=content)
+        return paste_page_response(paste, render)
         
     except Exception as e:
         print(f"Ошибка при просмотре приватной пасты: {e}")
         flash('Ошибка при загрузке приватной пасты', 'error')
         return redirect(url_for('index'))
 
+def send_raw_paste(paste):
+    """Отдает содержимое пасты как text/plain без шаблона
+
+    ETag - content_hash (содержимое пасты неизменно). Несжатые файлы отдаются
+    через send_file по пути (sendfile в gunicorn, Range обрабатывает werkzeug),
+    сжатые файлы и объекты MinIO - потоковой распаковкой; Range для них
+    обслуживается из памяти.
+    """
+    mimetype = 'text/plain; charset=utf-8'
+    etag = paste.content_hash
+    
+    # Клиенту уже известна эта версия - хранилище не читаем
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    # Небольшая паста уже загружена вместе со строкой БД
+    if paste.content is not None:
+        return send_file(io.BytesIO(paste.content.encode('utf-8')), mimetype=mimetype, etag=etag,
+                         conditional=True, last_modified=paste.created_at)
+    
+    path = None
+    if hasattr(storage, 'get_paste_content_path'):
+        path = storage.get_paste_content_path(paste.id, paste.content_hash)
+    
+    if path is not None:
+        try:
+            with open(path, 'rb') as f:
+                codec = compression.stored_codec(f.read(compression.HEADER_SIZE))
+            
+            if codec == 'none':
+                return send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                                 last_modified=paste.created_at)
+            
+            if not request.range:
+                def generate():
+                    with open(path, 'rb') as stored:
+                        yield from compression.iter_decoded(stored)
+                
+                # direct_passthrough: make_conditional не читает тело для Content-Length,
+                # ответ 304 закрывает поток, не распаковывая его
+                response = Response(stream_with_context(generate()), mimetype=mimetype, direct_passthrough=True)
+                response.set_etag(etag)
+                response.last_modified = paste.created_at
+                return response.make_conditional(request)
+        except FileNotFoundError:
+            return 'Содержимое пасты не найдено', 404
+    
+    # Хранилище без путей (MinIO): потоковая отдача, в памяти только текущая порция
+    if not request.range and path is None:
+        stream = storage.iter_paste_content(paste.id, paste.content_hash)
+        if stream is None:
+            return 'Содержимое пасты не найдено', 404
+        
+        response = Response(stream, mimetype=mimetype, direct_passthrough=True)
+        response.set_etag(etag)
+        response.last_modified = paste.created_at
+        return response.make_conditional(request)
+    
+    # Запрос диапазона по сжатому файлу или по объекту MinIO - из памяти
+    content = storage.get_paste_content(paste.id, paste.content_hash)
+    if content is None:
+        return 'Содержимое пасты не найдено', 404
+    
+    return send_file(io.BytesIO(content.encode('utf-8')), mimetype=mimetype, etag=etag,
+                     conditional=True, last_modified=paste.created_at)
+
+@app.route('/paste/<int:paste_id>/raw')
+def view_paste_raw(paste_id):
+    """Содержимое публичной пасты как есть (для curl и скриптов)"""
+    try:
+        paste = paste_with_content().get_or_404(paste_id)
+        
+        if paste.is_private:
+            return 'Эта паста является приватной', 403
+        
+        if paste.has_expired():
+            return 'Паста истекла', 410
+        
+        return send_raw_paste(paste)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при отдаче пасты {paste_id}: {e}")
+        return 'Ошибка при загрузке пасты', 500
+
+@app.route('/secret/<secret_key>/raw')
+def view_secret_paste_raw(secret_key):
+    """Содержимое приватной пасты как есть по секретному ключу"""
+    try:
+        paste = paste_with_content().filter_by(secret_key=secret_key, is_private=True).first()
+        
+        if not paste:
+            return 'Приватная паста не найдена или ключ неверный', 404
+        
+        if paste.has_expired():
+            return 'Приватная паста истекла', 410
+        
+        return send_raw_paste(paste)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при отдаче приватной пасты: {e}")
+        return 'Ошибка при загрузке приватной пасты', 500
+
 @app.route('/paste/<int:paste_id>/delete', methods=['POST'])
 def delete_paste(paste_id):
     """Удаление пасты"""
     try:
-        paste = Paste.query.get_or_404(paste_id)
+        paste = paste_with_content().get_or_404(paste_id)
         
         # Проверяем, не является ли паста приватной
         if paste.is_private:
             return jsonify({'success': False, 'error': 'Приватные пасты нельзя удалить через обычную ссылку'}), 403
         
-        # Удаляем содержимое из MinIO
-        storage.delete_paste_content(paste.id, paste.content_hash)
+        # Удаляем содержимое из хранилища (у небольших паст его там нет)
+        if paste.content is None:
+            storage.delete_paste_content(paste.id, paste.content_hash)
         
         # Удаляем из БД
+        record_paste_deleted(paste)
         db.session.delete(paste)
+        notify_public_pages_changed()
         db.session.commit()
+        mark_write()
+        public_pages_changed()
         
         return jsonify({'success': True, 'message': 'Паста успешно удалена'})
         
@@ -388,17 +642,21 @@ def delete_paste(paste_id):
 def delete_secret_paste(secret_key):
     """Удаление приватной пасты по секретному ключу"""
     try:
-        paste = Paste.query.filter_by(secret_key=secret_key, is_private=True).first()
+        paste = paste_with_content().filter_by(secret_key=secret_key, is_private=True).first()
         
         if not paste:
             return jsonify({'success': False, 'error': 'Приватная паста не найдена или ключ неверный'}), 404
         
-        # Удаляем содержимое из MinIO
-        storage.delete_paste_content(paste.id, paste.content_hash)
+        # Удаляем содержимое из хранилища (у небольших паст его там нет)
+        if paste.content is None:
+            storage.delete_paste_content(paste.id, paste.content_hash)
         
         # Удаляем из БД
+        record_paste_deleted(paste)
         db.session.delete(paste)
         db.session.commit()
+        mark_write()
+        public_pages_changed()
         
         return jsonify({'success': True, 'message': 'Приватная паста успешно удалена'})
         
@@ -408,96 +666,49 @@ def delete_secret_paste(secret_key):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/recent')
+@read_only
 def recent_pastes():
-    """Страница недавних паст"""
+    """Страница недавних паст (первая страница без фильтров кэшируется на PAGE_CACHE_TTL секунд)"""
+    if not request.args:
+        return cached_page('recent', render_recent)
+    return render_recent()[0]
+
+def render_recent():
+    """Рендерит страницу недавних паст по параметрам запроса: (html, сроки жизни показанных паст)"""
     try:
         # Получаем параметры поиска и фильтрации
         search_query = request.args.get('search', '').strip()
         category_filter = request.args.get('category', '').strip()
+        cursor = request.args.get('cursor', '').strip()
+        page_size = parse_page_size(
+            request.args.get('page_size'),
+            app.config['RECENT_PAGE_SIZE'],
+            app.config['MAX_PAGE_SIZE']
+        )
         
-        # Базовый запрос для паст (только публичные и не истекшие)
-        query = Paste.query.filter_by(is_expired=False, is_private=False)
-        
-        # Применяем фильтр по категории
-        if category_filter:
-            query = query.filter(Paste.language == category_filter)
-        
-        # Получаем все пасты для поиска по содержимому
-        all_pastes = query.order_by(Paste.created_at.desc()).all()
-        
-        # Загружаем содержимое для каждой пасты
-        for paste in all_pastes:
-            try:
-                paste.content = storage.get_paste_content(paste.id, paste.content_hash)
-                if paste.content is None:
-                    paste.content = "Ошибка загрузки содержимого"
-            except Exception as e:
-                print(f"Ошибка при загрузке содержимого пасты {paste.id}: {e}")
-                paste.content = "Ошибка загрузки содержимого"
-        
-        # Применяем поиск по названию и содержимому
-        if search_query:
-            filtered_pastes = []
-            search_lower = search_query.lower()
-            for paste in all_pastes:
-                # Поиск по названию
-                if search_lower in paste.title.lower():
-                    filtered_pastes.append(paste)
-                    continue
-                
-                # Поиск по содержимому (если содержимое доступно)
-                if paste.content and search_lower in paste.content.lower():
-                    filtered_pastes.append(paste)
-                    continue
-            pastes = filtered_pastes
-        else:
-            pastes = all_pastes
-        
-        # Проверяем истечение паст и обновляем их статус
-        expired_pastes_ids = []
-        for paste in pastes:
-            if paste.expires_at and paste.expires_at < datetime.now(timezone.utc):
-                paste.is_expired = True
-                expired_pastes_ids.append(paste.id)
-        
-        # Сохраняем изменения в БД если есть истекшие пасты
-        if expired_pastes_ids:
-            db.session.commit()
-            print(f"Пасты {expired_pastes_ids} помечены как истекшие")
-        
-        # Получаем статистику для страницы недавних паст (только публичные)
-        total_pastes_ever = get_stat('total_pastes_ever')  # Общее количество паст за все время
-        active_pastes = Paste.query.filter_by(is_expired=False, is_private=False).count()
-        expired_pastes = Paste.query.filter_by(is_expired=True, is_private=False).count()
+        search_mode = get_search_mode()
         
-        # Пасты за последние 7 дней (только публичные)
-        week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        pastes_this_week = Paste.query.filter(
-            Paste.created_at >= week_ago,
-            Paste.is_private == False
-        ).count()
+        # Получаем одну страницу паст (поиск по названию и содержимому - через индекс)
+        pastes, next_cursor = get_paste_page(search_query, category_filter, cursor, page_size, search_mode)
         
-        # Подсчитываем уникальные категории (только публичные)
-        categories = db.session.query(Paste.language).filter_by(is_private=False).distinct().count()
+        # Получаем статистику для страницы недавних паст (только публичные) из app_stats
+        stats = get_page_stats(app.config['STATS_SNAPSHOT_TTL'])
         
-        # Получаем список всех доступных категорий для фильтра (только публичные)
-        available_categories = db.session.query(Paste.language).filter_by(is_private=False).distinct().all()
-        category_list = [cat[0] for cat in available_categories if cat[0]]
+        # Категории для фильтра (активные публичные пасты) - из кэшированного фасета
+        category_facets = get_category_facets(app.config['CATEGORY_FACETS_TTL'])
         
-        stats = {
-            'total_pastes': total_pastes_ever,  # Используем общий счетчик
-            'active_pastes': active_pastes,
-            'expired_pastes': expired_pastes,
-            'pastes_this_week': pastes_this_week,
-            'categories': categories
-        }
-        
-        return render_template('recent.html', 
+        html = render_template('recent.html', 
                              pastes=pastes, 
                              stats=stats, 
                              search_query=search_query,
                              category_filter=category_filter,
-                             available_categories=category_list)
+                             available_categories=category_list(category_facets),
+                             category_facets=category_facets,
+                             cursor=cursor,
+                             next_cursor=next_cursor,
+                             page_size=page_size,
+                             search_mode=search_mode)
+        return html, [paste.expires_at for paste in pastes]
         
     except Exception as e:
         print(f"Ошибка при загрузке недавних паст: {e}")
@@ -512,7 +723,12 @@ def recent_pastes():
                              },
                              search_query='',
                              category_filter='',
-                             available_categories=[])
+                             available_categories=[],
+                             category_facets={},
+                             cursor='',
+                             next_cursor=None,
+                             page_size=app.config['RECENT_PAGE_SIZE'],
+                             search_mode=app.config['SEARCH_MODE']), None
 
 @app.route('/ai')
 def ai_helper_page():
@@ -552,44 +768,26 @@ def ai_models():
     })
 
 @app.route('/api/search')
+@read_only
 def api_search():
     """API для живого поиска паст"""
     try:
         search_query = request.args.get('q', '').strip()
         category_filter = request.args.get('category', '').strip()
+        cursor = request.args.get('cursor', '').strip()
+        page_size = parse_page_size(
+            request.args.get('page_size'),
+            app.config['SEARCH_RESULTS_LIMIT'],
+            app.config['MAX_PAGE_SIZE']
+        )
         
-        # Базовый запрос (только публичные и не истекшие)
-        query = Paste.query.filter_by(is_expired=False, is_private=False)
+        search_mode = get_search_mode()
         
-        # Применяем фильтр по категории
-        if category_filter:
-            query = query.filter(Paste.language == category_filter)
+        # Получаем одну страницу паст (содержимое из хранилища не читается)
+        pastes, next_cursor = get_paste_page(search_query, category_filter, cursor, page_size, search_mode)
         
-        # Получаем пасты
-        pastes = query.order_by(Paste.created_at.desc()).limit(100).all()
-        
-        # Загружаем содержимое для поиска
-        for paste in pastes:
-            try:
-                paste.content = storage.get_paste_content(paste.id, paste.content_hash)
-                if paste.content is None:
-                    paste.content = ""
-            except Exception as e:
-                paste.content = ""
-        
-        # Применяем поиск
-        if search_query:
-            search_lower = search_query.lower()
-            filtered_pastes = []
-            for paste in pastes:
-                if (search_lower in paste.title.lower() or 
-                    (paste.content and search_lower in paste.content.lower())):
-                    filtered_pastes.append(paste)
-            pastes = filtered_pastes
-        
-        # Получаем актуальный список категорий из активных паст (только публичные)
-        active_categories = db.session.query(Paste.language).filter_by(is_expired=False, is_private=False).distinct().all()
-        category_list = [cat[0] for cat in active_categories if cat[0]]
+        # Актуальный список категорий активных публичных паст (кэшированный фасет)
+        category_facets = get_category_facets(app.config['CATEGORY_FACETS_TTL'])
         
         # Формируем результат
         result = []
@@ -608,7 +806,11 @@ def api_search():
         return jsonify({
             'pastes': result,
             'total': len(result),
-            'categories': category_list
+            'categories': category_list(category_facets),
+            'category_counts': category_facets,
+            'next_cursor': next_cursor,
+            'page_size': page_size,
+            'mode': search_mode
         })
         
     except Exception as e:
@@ -616,16 +818,17 @@ def api_search():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/categories')
+@read_only
 def api_categories():
     """API для получения списка активных категорий"""
     try:
-        # Получаем только активные категории (не истекшие и публичные пасты)
-        active_categories = db.session.query(Paste.language).filter_by(is_expired=False, is_private=False).distinct().all()
-        category_list = [cat[0] for cat in active_categories if cat[0]]
+        # Только активные категории (не истекшие и публичные пасты) с количеством паст
+        category_facets = get_category_facets(app.config['CATEGORY_FACETS_TTL'])
         
         return jsonify({
-            'categories': category_list,
-            'total': len(category_list)
+            'categories': category_list(category_facets),
+            'counts': category_facets,
+            'total': len(category_facets)
         })
         
     except Exception as e:
@@ -853,42 +1056,22 @@ def manual_cleanup():
     """Ручная очистка истекших паст"""
     try:
         with app.app_context():
-            # Находим все истекшие пасты
-            expired_pastes = Paste.query.filter(
-                Paste.expires_at < datetime.now(timezone.utc)
-            ).all()
-            
-            deleted_count = 0
-            for paste in expired_pastes:
-                try:
-                    # Удаляем содержимое из MinIO
-                    storage.delete_paste_content(paste.id, paste.content_hash)
-                    
-                    # Удаляем метаданные из MinIO
-                    try:
-                        storage.delete_paste_metadata(paste.id)
-                    except:
-                        pass
-                    
-                    # Удаляем пасту из БД
-                    db.session.delete(paste)
-                    deleted_count += 1
-                    
-                except Exception as e:
-                    print(f"Ошибка при удалении пасты {paste.id}: {e}")
-            
-            if expired_pastes:
-                db.session.commit()
+            result = expiry_engine.run_once()
+            if result['deleted']:
                 return jsonify({
                     'success': True,
-                    'message': f'Удалено {deleted_count} истекших паст'
+                    'message': f"Удалено {result['deleted']} истекших паст",
+                    'files_deleted': result['files_deleted'],
+                    'files_failed': result['files_failed']
                 })
             else:
                 return jsonify({
                     'success': True,
-                    'message': 'Истекших паст не найдено'
+                    'message': 'Истекших паст не найдено',
+                    'files_deleted': result['files_deleted'],
+                    'files_failed': result['files_failed']
                 })
-                
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -896,6 +1079,60 @@ def manual_cleanup():
             'error': f'Ошибка при очистке: {str(e)}'
         }), 500
 
+@app.route('/admin/cache-stats')
+def cache_stats():
+    """Счетчики кэша содержимого и кэша страниц текущего воркера"""
+    stats = {**storage.get_cache_stats(), 'pages': page_cache.stats(), 'invalidation': cache_invalidation.status()}
+    if hasattr(storage.backend, 'get_tier_stats'):
+        stats['disk'] = storage.backend.get_tier_stats()
+    return jsonify(stats)
+
+@app.route('/admin/db-replicas')
+def db_replicas_status():
+    """Состояние реплик БД для чтения в текущем воркере"""
+    return jsonify({'replicas': replica_router.status()})
+
+@app.route('/admin/expiry-status')
+def expiry_status():
+    """Состояние фоновой очистки: этот воркер и текущий лидер"""
+    try:
+        return jsonify(expiry_worker.status())
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения состояния очистки: {str(e)}'}), 500
+
+@app.route('/admin/reindex', methods=['POST'])
+def manual_reindex():
+    """Индексирует пасты, отсутствующие в поисковом индексе"""
+    try:
+        indexed_count = rebuild_search_index(storage)
+        vector_count = backfill_search_vectors()
+        return jsonify({
+            'success': True,
+            'message': f'Проиндексировано {indexed_count} паст, заполнено полнотекстовых векторов: {vector_count}'
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'Ошибка при индексации: {str(e)}'
+        }), 500
+
+@app.route('/admin/backfill-previews', methods=['POST'])
+def manual_backfill_previews():
+    """Вычисляет превью для паст, у которых его еще нет"""
+    try:
+        preview_count = backfill_previews(storage)
+        return jsonify({
+            'success': True,
+            'message': f'Вычислено превью паст: {preview_count}'
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'Ошибка при вычислении превью: {str(e)}'
+        }), 500
+
 def generate_qr_code(data, size=200):
     """Генерирует QR-код и возвращает его как base64 строку"""
     try:
@@ -937,10 +1174,7 @@ def paste_qr_code(paste_id):
             return jsonify({'error': 'QR-код недоступен для приватных паст'}), 403
         
         # Проверяем, не истекла ли паста
-        if paste.expires_at and paste.expires_at < datetime.now(timezone.utc):
-            return jsonify({'error': 'QR-код недоступен для истекших паст'}), 403
-        
-        if paste.is_expired:
+        if paste.has_expired():
             return jsonify({'error': 'QR-код недоступен для истекших паст'}), 403
         
         # Генерируем URL для пасты
@@ -973,10 +1207,7 @@ def secret_paste_qr_code(secret_key):
             return jsonify({'error': 'Приватная паста не найдена'}), 404
         
         # Проверяем, не истекла ли паста
-        if paste.expires_at and paste.expires_at < datetime.now(timezone.utc):
-            return jsonify({'error': 'QR-код недоступен для истекших паст'}), 403
-        
-        if paste.is_expired:
+        if paste.has_expired():
             return jsonify({'error': 'QR-код недоступен для истекших паст'}), 403
         
         # Генерируем URL для приватной пасты
@@ -1006,15 +1237,11 @@ if __name__ == '__main__':
         db.create_all()
         print("База данных инициализирована")
         
-        # Инициализируем счетчик общего количества паст, если его нет
-        current_total = Paste.query.count()
-        if current_total > 0:
-            get_or_create_stat('total_pastes_ever', current_total)
-            print(f"Счетчик общего количества паст инициализирован: {current_total}")
-    
-    # Запуск потока очистки в фоне
-    cleanup_thread = threading.Thread(target=cleanup_expired_pastes, daemon=True)
-    cleanup_thread.start()
-    print("Запущен поток очистки истекших паст")
+        # Сверяем инкрементальную статистику с таблицей pastes (и создаем недостающие счетчики)
+        reconcile_stats()
+        
+        # Поисковые индексы (для db.create_all без миграций), индексация и превью существующих паст
+        ensure_search_index()
+        run_maintenance()
     
     app.run(debug=False, host='0.0.0.0', port=port)
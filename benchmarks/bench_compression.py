@@ -0,0 +1,93 @@
+"""Бенчмарк кодеков сжатия: CPU на запись/чтение против экономии диска и сети
+
+Запуск:
+    python benchmarks/bench_compression.py [--size 262144] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression
+
+
+def sample_log(size: int) -> str:
+    """Лог CI: повторяющиеся строки с меняющимися числами"""
+    rnd = random.Random(1)
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f"2026-10-18 12:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d} INFO "
+                     f"worker-{rnd.randint(1, 8)} processed job {rnd.randint(1, 10 ** 6)} in {rnd.random():.3f}s")
+    return '\n'.join(lines)[:size]
+
+
+def sample_json(size: int) -> str:
+    rnd = random.Random(2)
+    items = []
+    while sum(len(json.dumps(item)) for item in items) < size:
+        items.append({'id': rnd.randint(1, 10 ** 6), 'name': f"user{rnd.randint(1, 1000)}",
+                      'active': rnd.random() > 0.5, 'tags': ['a', 'b', 'c'][:rnd.randint(0, 3)]})
+    return json.dumps(items, indent=2)[:size]
+
+
+def sample_source(size: int) -> str:
+    with open(compression.__file__, encoding='utf-8') as f:
+        text = f.read()
+    return (text * (size // len(text) + 1))[:size]
+
+
+def sample_random(size: int) -> str:
+    rnd = random.Random(3)
+    return ''.join(chr(rnd.randint(33, 126)) for _ in range(size))
+
+
+def bench(content: str, codec: str, rounds: int) -> dict:
+    raw_size = len(content.encode('utf-8'))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        stored = compression.encode(content, codec, min_bytes=0)
+    encode_time = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        compression.decode(stored)
+    decode_time = (time.perf_counter() - started) / rounds
+
+    return {
+        'ratio': raw_size / len(stored),
+        'saved_pct': 100 * (1 - len(stored) / raw_size),
+        'encode_mb_s': raw_size / encode_time / 1e6,
+        'decode_mb_s': raw_size / decode_time / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк кодеков сжатия')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='Размер пасты, байт')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    codecs = ['gzip'] + (['zstd'] if compression.zstandard is not None else [])
+    samples = {
+        'log': sample_log(args.size),
+        'json': sample_json(args.size),
+        'source': sample_source(args.size),
+        'random': sample_random(args.size),
+    }
+
+    print(f"Размер пасты: {args.size} байт, проходов: {args.rounds}")
+    print(f"{'данные':<8} {'кодек':<6} {'сжатие':>8} {'экономия':>9} {'запись MB/s':>12} {'чтение MB/s':>12}")
+    for name, content in samples.items():
+        for codec in codecs:
+            r = bench(content, codec, args.rounds)
+            print(f"{name:<8} {codec:<6} {r['ratio']:>7.1f}x {r['saved_pct']:>8.1f}% "
+                  f"{r['encode_mb_s']:>12.1f} {r['decode_mb_s']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Бенчмарк создания пасты: прежний конвейер против текущего
+
+Два независимых замера:
+
+* хранилище - "до": файл содержимого и отдельный metadata.json в прежней
+  раскладке (плоский uploads/ без сжатия, объекты MinIO без сжатия);
+  "после": одна запись текущим хранилищем, небольшие пасты
+  (INLINE_CONTENT_MAX_BYTES) в хранилище не пишутся вовсе. Текущий
+  FileStorage дополнительно сжимает содержимое, поэтому он измеряется
+  дважды: с кодеком --codec и без сжатия;
+* БД (--database) - "до": INSERT, отдельный UPDATE превью, commit и
+  счетчик в отдельной транзакции (SELECT + UPDATE + commit), как в прежнем
+  create_paste; "после": один INSERT с превью, индекс и счетчики в одной
+  транзакции. Используется DATABASE_URL приложения; созданные строки и
+  изменения счетчиков после замера удаляются.
+
+Запуск:
+    python benchmarks/bench_create.py [--count 500] [--size 8192] [--minio] [--database]
+
+С --minio используются переменные MINIO_* (как у приложения), bucket должен быть доступен.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage_simple import FileStorage
+
+
+def sample_content(size: int, seed: int) -> str:
+    rnd = random.Random(seed)
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f"line {rnd.randint(1, 10 ** 6)}: value={rnd.random():.6f}")
+    return '\n'.join(lines)[:size]
+
+
+def legacy_metadata(paste_id: int) -> bytes:
+    """metadata.json в том виде, в каком его писал прежний create_paste"""
+    return json.dumps({
+        'title': f"bench {paste_id}",
+        'language': 'text',
+        'lifetime': 1440,
+        'is_private': False,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+class LegacyFileWrites:
+    """Запись прежнего FileStorage: плоский каталог, текст без сжатия, metadata.json рядом"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def create(self, paste_id: int, content: str):
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        with open(os.path.join(self.folder, f"{paste_id}_{content_hash}.txt"), 'w', encoding='utf-8') as f:
+            f.write(content)
+        with open(os.path.join(self.folder, f"{paste_id}_metadata.json"), 'wb') as f:
+            f.write(legacy_metadata(paste_id))
+
+    def cleanup(self, paste_ids: list):
+        for name in os.listdir(self.folder):
+            os.remove(os.path.join(self.folder, name))
+
+
+class LegacyMinioWrites:
+    """Запись прежнего MinioStorage: content.txt без сжатия и metadata.json - два put_object"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def create(self, paste_id: int, content: str):
+        data = content.encode('utf-8')
+        self.storage.client.put_object(self.storage.bucket_name, f"{paste_id}/content.txt", io.BytesIO(data),
+                                       length=len(data), content_type='text/plain')
+        metadata = legacy_metadata(paste_id)
+        self.storage.client.put_object(self.storage.bucket_name, f"{paste_id}/metadata.json", io.BytesIO(metadata),
+                                       length=len(metadata), content_type='application/json')
+
+    def cleanup(self, paste_ids: list):
+        self.storage.delete_paste_files([(paste_id, None) for paste_id in paste_ids])
+
+
+class CurrentWrites:
+    """Текущий путь: одна запись содержимого, небольшие пасты остаются в строке БД"""
+
+    def __init__(self, storage, inline_max_bytes: int):
+        self.storage = storage
+        self.inline_max_bytes = inline_max_bytes
+        self.items = []
+
+    def create(self, paste_id: int, content: str):
+        if len(content.encode('utf-8')) < self.inline_max_bytes:
+            return
+        self.items.append((paste_id, self.storage.save_paste_content(paste_id, content)))
+
+    def cleanup(self, paste_ids: list):
+        self.storage.delete_paste_files(self.items)
+        self.items = []
+
+
+def timed(create, contents: list, first_id: int) -> tuple:
+    """Создает пасты и возвращает (созданий в секунду, id)"""
+    paste_ids = [first_id + offset for offset in range(len(contents))]
+    started = time.perf_counter()
+    for paste_id, content in zip(paste_ids, contents):
+        create(paste_id, content)
+    return len(contents) / (time.perf_counter() - started), paste_ids
+
+
+def print_row(name: str, before: float, after: float):
+    print(f"{name:<12} {before:>12.0f} {after:>14.0f} {after / before:>9.2f}x")
+
+
+def bench_storage(name: str, legacy, current, contents: list, rounds: int):
+    results = {'до': [], 'после': []}
+    for round_index in range(rounds):
+        # Чередуем варианты, чтобы прогрев кэшей ФС/сети не давал преимущества одному из них
+        for label, writes in (('до', legacy), ('после', current)):
+            first_id = 10 ** 9 + (round_index * 2 + (label == 'после')) * len(contents)
+            rate, paste_ids = timed(writes.create, contents, first_id)
+            writes.cleanup(paste_ids)
+            results[label].append(rate)
+    print_row(name, max(results['до']), max(results['после']))
+
+
+LEGACY_TITLE = 'bench_create_legacy'
+CURRENT_TITLE = 'bench_create_current'
+
+
+def bench_database(contents: list, rounds: int, inline_max_bytes: int):
+    """Транзакции БД при создании: прежняя последовательность против текущей"""
+    os.environ.setdefault('EXPIRY_WORKER_ENABLED', 'false')
+    from sqlalchemy import text
+    from app import app
+    from models import db, Paste, AppStats
+    from previews import apply_preview
+    from search_index import index_paste
+    from stats import STAT_TOTAL_EVER, record_paste_created
+
+    def new_paste(title: str, content: str) -> Paste:
+        return Paste(
+            title=title,
+            content_hash=hashlib.sha256(content.encode('utf-8')).hexdigest(),
+            language='text',
+            lifetime=0,
+            is_private=False,
+            tags=[]
+        )
+
+    def create_legacy(_, content):
+        paste = new_paste(LEGACY_TITLE, content)
+        db.session.add(paste)
+        db.session.flush()
+        apply_preview(paste, content)  # После flush - отдельный UPDATE при commit
+        index_paste(paste, content)
+        db.session.commit()
+        # Прежний increment_stat: SELECT, UPDATE через ORM и собственный commit
+        stat = AppStats.query.filter_by(key=STAT_TOTAL_EVER).first()
+        stat.value += 1
+        stat.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+
+    def create_current(_, content):
+        paste = new_paste(CURRENT_TITLE, content)
+        if len(content.encode('utf-8')) < inline_max_bytes:
+            paste.content = content
+        apply_preview(paste, content)
+        db.session.add(paste)
+        db.session.flush()
+        index_paste(paste, content)
+        record_paste_created(paste)
+        db.session.commit()
+
+    with app.app_context():
+        db.session.execute(text(
+            "INSERT INTO app_stats (key, value, updated_at) VALUES (:key, 0, now()) ON CONFLICT (key) DO NOTHING"
+        ), {'key': STAT_TOTAL_EVER})
+        db.session.commit()
+
+        results = {'до': [], 'после': []}
+        try:
+            for _ in range(rounds):
+                for label, create in (('до', create_legacy), ('после', create_current)):
+                    rate, _ = timed(create, contents, 0)
+                    results[label].append(rate)
+        finally:
+            db.session.rollback()
+            _cleanup_database()
+
+    print_row('db', max(results['до']), max(results['после']))
+
+
+def _cleanup_database():
+    """Удаляет пасты бенчмарка (строки индекса - каскадом) и откатывает изменения счетчиков"""
+    from models import db, Paste
+    from stats import STAT_TOTAL_EVER, increment_counters, merge_deltas, paste_deleted_deltas
+
+    rows = db.session.query(
+        Paste.title, Paste.is_private, Paste.is_expired, Paste.language, Paste.created_at
+    ).filter(Paste.title.in_([LEGACY_TITLE, CURRENT_TITLE])).all()
+
+    deltas = {STAT_TOTAL_EVER: -len(rows)}
+    for row in rows:
+        # Прежний конвейер менял только общий счетчик, текущий - еще и счетчики публичных паст
+        if row.title == CURRENT_TITLE:
+            merge_deltas(deltas, paste_deleted_deltas(row.is_private, row.is_expired, row.language, row.created_at))
+
+    Paste.query.filter(Paste.title.in_([LEGACY_TITLE, CURRENT_TITLE])).delete(synchronize_session=False)
+    increment_counters(deltas)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк создания пасты')
+    parser.add_argument('--count', type=int, default=500, help='Паст за проход')
+    parser.add_argument('--size', type=int, default=8192, help='Размер пасты, байт')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--inline-max-bytes', type=int,
+                        default=int(os.getenv('INLINE_CONTENT_MAX_BYTES', 4096)),
+                        help='Порог хранения в строке БД (как INLINE_CONTENT_MAX_BYTES)')
+    parser.add_argument('--codec', default=os.getenv('STORAGE_COMPRESSION', 'auto'),
+                        help='Сжатие текущего FileStorage (как STORAGE_COMPRESSION)')
+    parser.add_argument('--minio', action='store_true', help='Измерить также MinioStorage')
+    parser.add_argument('--database', action='store_true', help='Измерить транзакции БД (DATABASE_URL)')
+    args = parser.parse_args()
+
+    contents = [sample_content(args.size, seed) for seed in range(args.count)]
+
+    print(f"Паст за проход: {args.count}, размер: {args.size} байт, проходов: {args.rounds}")
+    print(f"{'замер':<12} {'до, паст/с':>12} {'после, паст/с':>14} {'ускорение':>10}")
+
+    # Прежний путь писал без сжатия: строка с codec=none отделяет выигрыш конвейера от цены сжатия
+    for codec in (args.codec, 'none'):
+        folder = tempfile.mkdtemp(prefix='bench_create_')
+        try:
+            bench_storage(f"file/{codec}", LegacyFileWrites(os.path.join(folder, 'legacy')),
+                          CurrentWrites(FileStorage(os.path.join(folder, 'current'), codec=codec),
+                                        args.inline_max_bytes),
+                          contents, args.rounds)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if args.minio:
+        from storage import MinioStorage
+        storage = MinioStorage()
+        bench_storage('minio', LegacyMinioWrites(storage), CurrentWrites(storage, args.inline_max_bytes),
+                      contents, args.rounds)
+
+    if args.database:
+        bench_database(contents, args.rounds, args.inline_max_bytes)
+
+
+if __name__ == '__main__':
+    main()
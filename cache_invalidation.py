@@ -0,0 +1,101 @@
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import db
+
+# Сброс кэшей списков паст во всех воркерах gunicorn и во всех репликах.
+# Кэши живут в памяти воркера, поэтому транзакция, меняющая набор публичных паст,
+# отправляет NOTIFY в канал PUBLIC_PAGES_CHANNEL (доставляется только после commit),
+# а каждый воркер слушает канал на отдельном соединении и сбрасывает свои кэши.
+
+PUBLIC_PAGES_CHANNEL = 'public_pages'
+
+
+def notify_public_pages_changed():
+    """Сообщает всем воркерам, что набор публичных паст изменился (доставляется после commit)"""
+    db.session.execute(text("SELECT pg_notify(:channel, '')"), {'channel': PUBLIC_PAGES_CHANNEL})
+
+
+class CacheInvalidationListener:
+    """Поток воркера, вызывающий on_change по уведомлениям из PUBLIC_PAGES_CHANNEL
+
+    Пока соединение LISTEN потеряно, уведомления пропадают: кэши сбрасываются
+    при потере соединения и еще раз после его восстановления, а в промежутке
+    их свежесть ограничена только собственным TTL.
+    """
+
+    def __init__(self, app, on_change, retry_interval: float = 5.0, check_interval: float = 30.0):
+        self.app = app
+        self.on_change = on_change
+        self.retry_interval = retry_interval
+        self.check_interval = check_interval  # Как часто проверять соединение без уведомлений, секунд
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.listening = False
+        self.notifications = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        """Запускает поток в текущем процессе (повторный вызов после fork запускает новый)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self.listening = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    connection = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+                    try:
+                        connection.execute(text(f"LISTEN {PUBLIC_PAGES_CHANNEL}"))
+                        self.listening = True
+                        # Изменения, сделанные пока соединения не было, уведомлений не оставили
+                        self.on_change()
+                        self._listen(connection)
+                    finally:
+                        self.listening = False
+                        try:
+                            connection.close()
+                        except Exception:
+                            pass
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"❌ Ошибка соединения для сброса кэшей: {e}")
+            self.on_change()
+            time.sleep(self.retry_interval)
+
+    def _listen(self, connection):
+        raw = connection.connection.dbapi_connection
+        while True:
+            if not raw.notifies:
+                readable, _, _ = select.select([raw], [], [], self.check_interval)
+                if not readable:
+                    # Уведомлений давно не было - убеждаемся, что соединение живо
+                    connection.execute(text("SELECT 1"))
+            raw.poll()
+            if raw.notifies:
+                self.notifications += len(raw.notifies)
+                del raw.notifies[:]
+                self.on_change()
+
+    def status(self) -> dict:
+        return {
+            'running': self._thread is not None and self._pid == os.getpid() and self._thread.is_alive(),
+            'listening': self.listening,
+            'notifications': self.notifications,
+            'errors': self.errors,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,210 @@
+import itertools
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен, без него используется gzip
+    zstandard = None
+
+# Формат сжатого blob: MAGIC (4 байта) + id кодека (1 байт) + сжатые данные.
+# Байт 0x89 не может начинать корректный UTF-8, поэтому старые несжатые файлы
+# (просто UTF-8 текст) однозначно отличаются от сжатых и читаются как раньше.
+MAGIC = b'\x89PBC'
+HEADER_SIZE = len(MAGIC) + 1
+
+CODEC_NONE = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+
+CODEC_IDS = {'none': CODEC_NONE, 'gzip': CODEC_GZIP, 'zstd': CODEC_ZSTD}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+# Содержимое меньше этого размера сжимать невыгодно
+DEFAULT_MIN_BYTES = 512
+
+
+def resolve_codec(name: str) -> str:
+    """Выбирает кодек: 'auto' - zstd если установлен, иначе gzip"""
+    name = (name or 'auto').lower()
+    if name == 'auto':
+        return 'zstd' if zstandard is not None else 'gzip'
+    if name == 'zstd' and zstandard is None:
+        print("zstandard не установлен, используется gzip")
+        return 'gzip'
+    if name not in CODEC_IDS:
+        print(f"Неизвестный кодек сжатия '{name}', сжатие отключено")
+        return 'none'
+    return name
+
+
+def encode(content: str, codec: str, min_bytes: int = DEFAULT_MIN_BYTES) -> bytes:
+    """Кодирует содержимое пасты в байты для хранения"""
+    return encode_bytes(content.encode('utf-8'), codec, min_bytes)
+
+
+def encode_bytes(raw: bytes, codec: str, min_bytes: int = DEFAULT_MIN_BYTES) -> bytes:
+    """Кодирует UTF-8 байты пасты для хранения"""
+    if codec == 'none' or len(raw) < min_bytes:
+        return raw
+
+    if codec == 'zstd':
+        payload = zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        payload = zlib.compress(raw, 6)
+
+    # Несжимаемые данные храним как есть
+    if len(payload) + HEADER_SIZE >= len(raw):
+        return raw
+
+    return MAGIC + bytes([CODEC_IDS[codec]]) + payload
+
+
+def stored_codec(data: bytes) -> str:
+    """Определяет кодек по заголовку сохраненных данных"""
+    if data[:len(MAGIC)] == MAGIC and len(data) >= HEADER_SIZE:
+        return CODEC_NAMES.get(data[len(MAGIC)], 'none')
+    return 'none'
+
+
+def decode(data: bytes) -> str:
+    """Декодирует сохраненные байты обратно в текст пасты"""
+    codec = stored_codec(data)
+    if codec == 'none':
+        return data.decode('utf-8')
+
+    payload = data[HEADER_SIZE:]
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Паста сжата zstd, но модуль zstandard не установлен')
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=2 ** 31).decode('utf-8')
+    return zlib.decompress(payload).decode('utf-8')
+
+
+def _iter_reader(reader, chunk_size: int):
+    # Конец потока - любая пустая порция: b'' у бинарных и '' у текстовых файлов
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_source(source, chunk_size: int = 64 * 1024):
+    """Порции байтов из файлоподобного объекта, итератора bytes/str или строки"""
+    if isinstance(source, (str, bytes)):
+        source = [source]
+    elif hasattr(source, 'read'):
+        source = _iter_reader(source, chunk_size)
+
+    for chunk in source:
+        if isinstance(chunk, str):
+            # Режем по символам: каждая порция кодируется целиком, без разрыва символов
+            for start in range(0, len(chunk), chunk_size):
+                yield chunk[start:start + chunk_size].encode('utf-8')
+        elif chunk:
+            yield bytes(chunk)
+
+
+def iter_encoded(chunks, codec: str, min_bytes: int = DEFAULT_MIN_BYTES):
+    """Потоково кодирует UTF-8 байты пасты в формат хранения (тот же, что у encode)
+
+    Данные меньше min_bytes хранятся как есть. Остальное пишется сжатым потоком
+    без проверки выгоды - размер заранее неизвестен. Память ограничена порцией.
+    """
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= min_bytes:
+            break
+
+    if codec == 'none' or len(head) < min_bytes:
+        if head:
+            yield head
+        yield from chunks
+        return
+
+    if codec == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        compressor = zlib.compressobj(6)
+
+    yield MAGIC + bytes([CODEC_IDS[codec]])
+    for chunk in itertools.chain([head], chunks):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    tail = compressor.flush()
+    if tail:
+        yield tail
+
+
+class DecodedStream:
+    """Итератор распакованных порций содержимого поверх открытого источника
+
+    close() освобождает источник (файл, ответ MinIO), даже если перебор не начинался:
+    werkzeug вызывает его по завершении ответа, в том числе при обрыве соединения.
+    """
+
+    def __init__(self, fileobj, close=None, chunk_size: int = 64 * 1024):
+        self._chunks = iter_decoded(fileobj, chunk_size)
+        self._close = close or fileobj.close
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._chunks.close()
+        self._close()
+
+
+def iter_decoded(fileobj, chunk_size: int = 64 * 1024):
+    """Потоково распаковывает сохраненные данные, выдавая байты UTF-8 порциями
+
+    Память на запрос ограничена размером порции, а не размером пасты.
+    """
+    header = fileobj.read(HEADER_SIZE)
+    codec = stored_codec(header)
+
+    if codec == 'none':
+        if header:
+            yield header
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Паста сжата zstd, но модуль zstandard не установлен')
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj)
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    decompressor = zlib.decompressobj()
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        data = decompressor.decompress(chunk, chunk_size)
+        if data:
+            yield data
+        # Ограничиваем размер выдаваемой порции при сильном сжатии
+        while decompressor.unconsumed_tail:
+            data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+            if data:
+                yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
@@ -23,10 +23,72 @@ class Config:
         'pool_recycle': 300,
     }
     
+    # Реплики для чтения (через запятую); пусто - все запросы идут на основную БД
+    DATABASE_REPLICA_URLS = os.getenv('DATABASE_REPLICA_URLS', '')
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 5))  # Чтение с основной БД после записи
+    REPLICA_RETRY_INTERVAL = float(os.getenv('REPLICA_RETRY_INTERVAL', 30))  # Через сколько секунд проверять недоступную реплику
+    REPLICA_CONNECT_TIMEOUT = int(os.getenv('REPLICA_CONNECT_TIMEOUT', 3))  # Таймаут соединения с репликой, секунд
+    
+    # Хранилище содержимого: file (локальные файлы), minio или tiered (MinIO + локальный дисковый кэш)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'file')
+    TIERED_CACHE_DIR = os.getenv('TIERED_CACHE_DIR', 'cache/pastes')
+    TIERED_CACHE_MAX_BYTES = int(os.getenv('TIERED_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB
+    
     # Файловое хранилище (вместо MinIO)
     UPLOAD_FOLDER = 'uploads'
+    STORAGE_DEDUP = os.getenv('STORAGE_DEDUP', 'true').lower() == 'true'  # Одинаковое содержимое хранится один раз
+    STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'auto')  # auto (zstd или gzip), zstd, gzip, none
+    COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 512))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
+    # Пасты меньше этого размера (байт UTF-8) хранятся прямо в строке pastes.content
+    # (сжимает TOAST Postgres), без файлов в хранилище; 0 - все пасты в хранилище
+    INLINE_CONTENT_MAX_BYTES = int(os.getenv('INLINE_CONTENT_MAX_BYTES', 4096))
+    
+    # Кэш содержимого паст в памяти воркера (0 - отключен)
+    CONTENT_CACHE_MAX_BYTES = int(os.getenv('CONTENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 64MB
+    
+    # Превью паст для списков (хранится в БД, содержимое из хранилища на списках не читается)
+    PREVIEW_MAX_LINES = int(os.getenv('PREVIEW_MAX_LINES', 10))
+    PREVIEW_MAX_CHARS = int(os.getenv('PREVIEW_MAX_CHARS', 500))
+    
+    # HTTP-кэширование страниц паст (max-age не больше оставшегося времени жизни)
+    PASTE_CACHE_MAX_AGE = int(os.getenv('PASTE_CACHE_MAX_AGE', 300))  # секунд
+    
+    # Буферизованный счетчик просмотров: запись в БД раз в N секунд или N просмотров
+    VIEW_FLUSH_INTERVAL = float(os.getenv('VIEW_FLUSH_INTERVAL', 5))
+    VIEW_FLUSH_MAX_PENDING = int(os.getenv('VIEW_FLUSH_MAX_PENDING', 100))
+    VIEW_READ_YOUR_VIEWS = os.getenv('VIEW_READ_YOUR_VIEWS', 'true').lower() == 'true'  # Учитывать незаписанные просмотры при показе
+    
+    # Инкрементальная статистика: снимок в памяти воркера и периодическая сверка с таблицей pastes
+    STATS_SNAPSHOT_TTL = float(os.getenv('STATS_SNAPSHOT_TTL', 5))  # секунд
+    STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', 600))  # секунд
+    CATEGORY_FACETS_TTL = float(os.getenv('CATEGORY_FACETS_TTL', 30))  # Кэш категорий с количеством паст, секунд
+    PAGE_CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL', 10))  # Кэш HTML главной и первой страницы /recent, секунд (0 - отключен)
+    CACHE_INVALIDATION_ENABLED = os.getenv('CACHE_INVALIDATION_ENABLED', 'true').lower() == 'true'  # Сброс кэшей всех воркеров через LISTEN/NOTIFY
+    
+    # Очистка истекших паст: размер порции (одна транзакция и один пакет удаления файлов)
+    EXPIRY_CHUNK_SIZE = int(os.getenv('EXPIRY_CHUNK_SIZE', 500))
+    
+    # Фоновая очистка с выбором лидера (advisory-блокировка Postgres)
+    EXPIRY_WORKER_ENABLED = os.getenv('EXPIRY_WORKER_ENABLED', 'true').lower() == 'true'
+    EXPIRY_INTERVAL = float(os.getenv('EXPIRY_INTERVAL', 300))  # секунд между страховочными очистками у лидера
+    EXPIRY_HEAP_SIZE = int(os.getenv('EXPIRY_HEAP_SIZE', 1000))  # Сколько ближайших дедлайнов держать в памяти
+    EXPIRY_LEADER_RETRY = float(os.getenv('EXPIRY_LEADER_RETRY', 15))  # секунд между попытками стать лидером
+    
+    # Поиск по пастам (триграммный индекс pg_trgm)
+    SEARCH_INDEX_MAX_CHARS = int(os.getenv('SEARCH_INDEX_MAX_CHARS', 1024 * 1024))  # Сколько символов содержимого индексировать
+    SEARCH_RESULTS_LIMIT = int(os.getenv('SEARCH_RESULTS_LIMIT', 100))
+    
+    # Полнотекстовый поиск (tsvector): режим по умолчанию, словарь и сколько символов содержимого индексировать
+    SEARCH_MODE = os.getenv('SEARCH_MODE', 'substring')  # substring (pg_trgm) или fts (websearch_to_tsquery + ts_rank)
+    SEARCH_FTS_LANGUAGE = os.getenv('SEARCH_FTS_LANGUAGE', 'russian')
+    SEARCH_FTS_MAX_CHARS = int(os.getenv('SEARCH_FTS_MAX_CHARS', 100 * 1024))
+    
+    # Keyset-пагинация списков паст
+    RECENT_PAGE_SIZE = int(os.getenv('RECENT_PAGE_SIZE', 20))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+    
     # AI настройки (если используется)
     OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
     OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama2')
@@ -46,6 +108,8 @@ class TestingConfig(Config):
     """Конфигурация для тестирования"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    EXPIRY_WORKER_ENABLED = False
+    CACHE_INVALIDATION_ENABLED = False
 
 # Словарь конфигураций
 config = {
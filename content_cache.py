@@ -0,0 +1,158 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+
+class LRUByteCache:
+    """Потокобезопасный LRU-кэш, ограниченный суммарным размером значений в байтах"""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int = None):
+        self.max_bytes = max_bytes
+        # Одна большая паста не должна вытеснять весь кэш
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else max_bytes // 8
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _sizeof(value) -> int:
+        return sys.getsizeof(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if self.max_bytes <= 0 or size > self.max_item_bytes:
+            return
+
+        with self._lock:
+            old_entry = self._items.pop(key, None)
+            if old_entry is not None:
+                self.current_bytes -= old_entry[1]
+
+            self._items[key] = (value, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self._items:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._items.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'entries': len(self._items),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'max_item_bytes': self.max_item_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class CachedStorage:
+    """Кэш содержимого паст поверх FileStorage/MinioStorage
+
+    Ключ кэша - (paste_id, content_hash): содержимое пасты неизменно, поэтому
+    запись не устаревает, пока паста существует. Кэш живет в памяти процесса,
+    т.е. у каждого воркера gunicorn свой. Остальные методы хранилища
+    проксируются без изменений.
+    """
+
+    def __init__(self, backend, max_bytes: int = 64 * 1024 * 1024):
+        self.backend = backend
+        self.cache = LRUByteCache(max_bytes)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def save_paste_content(self, paste_id: int, content: str) -> str:
+        """Сохраняет содержимое и сразу кладет его в кэш (после создания пасту обычно открывают)"""
+        content_hash = self.backend.save_paste_content(paste_id, content)
+        self.cache.put((paste_id, content_hash), content)
+        return content_hash
+
+    def save_paste_content_stream(self, paste_id: int, source) -> str:
+        """Сохраняет содержимое потоком; в кэш не кладется - целиком оно в памяти не бывает"""
+        return self.backend.save_paste_content_stream(paste_id, source)
+
+    def get_paste_content(self, paste_id: int, content_hash: str) -> str:
+        """Получает содержимое пасты из кэша или из хранилища"""
+        key = (paste_id, content_hash)
+        content = self.cache.get(key)
+        if content is not None:
+            return content
+
+        content = self.backend.get_paste_content(paste_id, content_hash)
+        if content is not None:
+            self.cache.put(key, content)
+        return content
+
+    def iter_paste_content(self, paste_id: int, content_hash: str, chunk_size: int = 64 * 1024):
+        """Содержимое порциями: из кэша одной порцией, иначе - потоком из хранилища (в кэш не кладется)"""
+        content = self.cache.get((paste_id, content_hash))
+        if content is not None:
+            return [content.encode('utf-8')]
+        return self.backend.iter_paste_content(paste_id, content_hash, chunk_size)
+
+    def get_paste_contents(self, items: list) -> dict:
+        """Содержимое нескольких паст: из кэша, остальные - одним обращением к хранилищу"""
+        contents = {}
+        missing = []
+        for paste_id, content_hash in items:
+            content = self.cache.get((paste_id, content_hash))
+            if content is not None:
+                contents[paste_id] = content
+            else:
+                missing.append((paste_id, content_hash))
+
+        if missing:
+            loaded = self.backend.get_paste_contents(missing)
+            for paste_id, content_hash in missing:
+                content = loaded.get(paste_id)
+                if content is not None:
+                    self.cache.put((paste_id, content_hash), content)
+                    contents[paste_id] = content
+        return contents
+
+    def delete_paste_content(self, paste_id: int, content_hash: str):
+        """Удаляет содержимое пасты из хранилища и из кэша"""
+        self.cache.invalidate((paste_id, content_hash))
+        return self.backend.delete_paste_content(paste_id, content_hash)
+
+    def delete_paste_files(self, items: list) -> dict:
+        """Пакетно удаляет содержимое и метаданные паст из хранилища и из кэша"""
+        for paste_id, content_hash in items:
+            self.cache.invalidate((paste_id, content_hash))
+        return self.backend.delete_paste_files(items)
+
+    def get_cache_stats(self) -> dict:
+        """Счетчики кэша текущего процесса"""
+        return self.cache.stats()
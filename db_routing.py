@@ -0,0 +1,184 @@
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+# Маршрутизация чтения на реплики PostgreSQL.
+# Обработчики, помеченные @read_only, выполняют SELECT на одной из реплик
+# (по кругу, недоступные реплики временно исключаются). Все записи, flush и
+# запросы вне таких обработчиков идут на основную БД. После записи браузер
+# REPLICA_STICKY_SECONDS секунд читает с основной БД (read-your-writes).
+
+
+class ReplicaRouter:
+    """Пул движков реплик с выбором по кругу и временным исключением недоступных"""
+
+    def __init__(self):
+        self.urls = []
+        self.engine_options = {}
+        self.retry_interval = 30.0
+        self._engines = {}
+        self._down_until = {}
+        self._checked_at = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        urls = app.config.get('DATABASE_REPLICA_URLS') or ''
+        self.urls = [url.strip() for url in urls.split(',') if url.strip()]
+        self.engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        # Недоступная реплика не должна задерживать запрос на полный таймаут соединения
+        connect_args = dict(self.engine_options.get('connect_args') or {})
+        connect_args.setdefault('connect_timeout', app.config.get('REPLICA_CONNECT_TIMEOUT', 3))
+        self.engine_options['connect_args'] = connect_args
+        self.retry_interval = app.config.get('REPLICA_RETRY_INTERVAL', 30.0)
+        if self.urls:
+            print(f"Чтение направляется на реплики БД: {len(self.urls)}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def _engine(self, url):
+        # Движки создаются в каждом процессе заново (пулы соединений не переживают fork)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._engines = {}
+                    self._down_until = {}
+                    self._checked_at = {}
+                    self._pid = os.getpid()
+
+        engine = self._engines.get(url)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(url)
+                if engine is None:
+                    engine = create_engine(url, **self.engine_options)
+                    event.listen(engine, 'handle_error', self._on_error(url))
+                    self._engines[url] = engine
+        return engine
+
+    def _on_error(self, url):
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_down(url)
+        return handle_error
+
+    def mark_down(self, url):
+        """Исключает реплику на retry_interval секунд"""
+        with self._lock:
+            already_down = url in self._down_until and self._down_until[url] > time.monotonic()
+            self._down_until[url] = time.monotonic() + self.retry_interval
+        if not already_down:
+            print(f"Реплика БД недоступна, чтение переключено на другие узлы: {_safe_url(url)}")
+
+    def _is_healthy(self, url) -> bool:
+        """Можно ли читать с реплики сейчас (проверка соединения идет в фоне, запрос ее не ждет)
+
+        Исправная реплика раз в retry_interval проверяется фоновым SELECT 1 и до
+        его результата считается доступной. Исключенная реплика после срока
+        исключения возвращается в работу только после успешной фоновой проверки.
+        """
+        now = time.monotonic()
+        with self._lock:
+            down_until = self._down_until.get(url)
+            probe_due = ((down_until is None or down_until <= now)
+                         and now - self._checked_at.get(url, float('-inf')) >= self.retry_interval)
+            if probe_due:
+                self._checked_at[url] = now
+        if probe_due:
+            threading.Thread(target=self._probe, args=(url,), daemon=True).start()
+        return down_until is None
+
+    def _probe(self, url):
+        try:
+            with self._engine(url).connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down(url)
+            return
+        with self._lock:
+            self._down_until.pop(url, None)
+
+    def choose(self):
+        """Следующая доступная реплика по кругу или None (тогда читаем с основной БД)"""
+        if not self.urls:
+            return None
+        start = next(self._counter)
+        for offset in range(len(self.urls)):
+            url = self.urls[(start + offset) % len(self.urls)]
+            if self._is_healthy(url):
+                return self._engine(url)
+        return None
+
+    def status(self) -> list:
+        now = time.monotonic()
+        return [
+            {
+                'url': _safe_url(url),
+                'healthy': url not in self._down_until,
+                'retry_in': max(round(self._down_until.get(url, 0) - now, 1), 0)
+            }
+            for url in self.urls
+        ]
+
+
+def _safe_url(url: str) -> str:
+    """URL без пароля для логов"""
+    try:
+        return make_url(url).render_as_string(hide_password=True)
+    except Exception:
+        return '<replica>'
+
+
+replica_router = ReplicaRouter()
+
+
+def _replica_engine():
+    """Реплика для текущего запроса (одна на запрос, чтобы чтения были согласованы)"""
+    if not has_app_context() or not g.get('db_read_only'):
+        return None
+    if 'db_replica' not in g:
+        g.db_replica = replica_router.choose()
+    return g.db_replica
+
+
+class RoutingSession(Session):
+    """Сессия Flask-SQLAlchemy, отправляющая SELECT read-only обработчиков на реплики"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select):
+            engine = _replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Помечает обработчик как только читающий: его запросы могут идти на реплику"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if replica_router.enabled and not _recently_wrote():
+            g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def mark_write():
+    """Запоминает запись в сессии браузера, чтобы он какое-то время читал с основной БД"""
+    if replica_router.enabled:
+        session['db_wrote_at'] = time.time()
+
+
+def _recently_wrote() -> bool:
+    wrote_at = session.get('db_wrote_at')
+    return wrote_at is not None and time.time() - wrote_at < current_app.config.get('REPLICA_STICKY_SECONDS', 5)
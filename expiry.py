@@ -0,0 +1,430 @@
+import heapq
+import os
+import select
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from cache_invalidation import notify_public_pages_changed
+from models import db
+from stats import paste_deleted_deltas, merge_deltas, increment_counters, reconcile_stats
+
+# Удаление истекших паст порциями.
+# Каждая порция - одна короткая транзакция: DELETE ... RETURNING удаляет строки
+# и в том же запросе ставит их файлы в очередь expired_blob_queue (контрольная точка).
+# Файлы удаляются из хранилища одним пакетом на порцию уже после commit; строки очереди
+# убираются только после успешного удаления, поэтому прерванная очистка
+# продолжается со следующего запуска без потерь и без "висящих" файлов.
+
+DELETE_EXPIRED_CHUNK = text("""
+    WITH doomed AS (
+        SELECT id FROM pastes
+        WHERE expires_at < :now
+        ORDER BY expires_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ), deleted AS (
+        DELETE FROM pastes p
+        USING doomed
+        WHERE p.id = doomed.id
+        RETURNING p.id, p.content_hash, p.is_private, p.is_expired, p.language, p.created_at,
+                  p.content IS NOT NULL AS is_inline
+    ), queued AS (
+        -- У небольших паст содержимое было в самой строке, файлов в хранилище нет
+        INSERT INTO expired_blob_queue (paste_id, content_hash, queued_at, attempts)
+        SELECT id, content_hash, :now, 0 FROM deleted WHERE NOT is_inline
+        ON CONFLICT (paste_id) DO NOTHING
+    )
+    SELECT id, content_hash, is_private, is_expired, language, created_at FROM deleted
+""")
+
+# Сначала строки с меньшим числом неудачных попыток: файлы, которые не удаляются
+# раз за разом, уходят в конец очереди и не блокируют удаление новых
+CLAIM_BLOB_CHUNK = text("""
+    SELECT paste_id, content_hash FROM expired_blob_queue
+    ORDER BY attempts, queued_at
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+""")
+
+
+class ExpiryEngine:
+    """Порционное удаление истекших паст и их файлов"""
+
+    def __init__(self, storage, chunk_size: int = 500, on_deleted=None):
+        self.storage = storage
+        self.on_deleted = on_deleted  # Вызывается после удаления порции (сброс кэшей списков паст)
+        self.chunk_size = chunk_size
+
+    def delete_expired_chunk(self, now: datetime = None) -> list:
+        """Удаляет одну порцию истекших паст. Возвращает удаленные строки"""
+        now = now or datetime.now(timezone.utc)
+        rows = db.session.execute(DELETE_EXPIRED_CHUNK, {'now': now, 'limit': self.chunk_size}).fetchall()
+
+        # Статистика меняется в той же транзакции, одним запросом на порцию
+        deltas = {}
+        for row in rows:
+            merge_deltas(deltas, paste_deleted_deltas(
+                row.is_private, row.is_expired, row.language, row.created_at, by_expiry=True
+            ))
+        increment_counters(deltas)
+        if any(not row.is_private for row in rows):
+            notify_public_pages_changed()
+
+        db.session.commit()
+        if rows and self.on_deleted is not None:
+            self.on_deleted()
+        return rows
+
+    def process_blob_queue_chunk(self) -> tuple:
+        """Удаляет файлы одной порции из очереди. Возвращает (удалено, ошибок)"""
+        rows = db.session.execute(CLAIM_BLOB_CHUNK, {'limit': self.chunk_size}).fetchall()
+        if not rows:
+            db.session.commit()
+            return 0, 0
+
+        # Одним пакетом: для MinIO это remove_objects вместо запроса на каждый объект
+        try:
+            failed = self.storage.delete_paste_files([(row.paste_id, row.content_hash) for row in rows])
+        except Exception as e:
+            failed = {row.paste_id: str(e) for row in rows}
+
+        for paste_id, error in failed.items():
+            print(f"Ошибка при удалении файлов пасты {paste_id}: {error}")
+        done_ids = [row.paste_id for row in rows if row.paste_id not in failed]
+        failed_ids = list(failed)
+
+        if done_ids:
+            db.session.execute(
+                text("DELETE FROM expired_blob_queue WHERE paste_id = ANY(:ids)"),
+                {'ids': done_ids}
+            )
+        if failed_ids:
+            db.session.execute(
+                text("UPDATE expired_blob_queue SET attempts = attempts + 1 WHERE paste_id = ANY(:ids)"),
+                {'ids': failed_ids}
+            )
+        db.session.commit()
+        return len(done_ids), len(failed_ids)
+
+    def run_once(self) -> dict:
+        """Удаляет все истекшие на данный момент пасты и их файлы"""
+        result = {'deleted': 0, 'files_deleted': 0, 'files_failed': 0, 'chunks': 0}
+        now = datetime.now(timezone.utc)
+
+        # Сначала дочищаем файлы, оставшиеся от прерванного запуска
+        self._drain_blob_queue(result)
+
+        while True:
+            rows = self.delete_expired_chunk(now)
+            result['deleted'] += len(rows)
+            result['chunks'] += 1
+            self._drain_blob_queue(result)
+            if len(rows) < self.chunk_size:
+                break
+
+        return result
+
+    def _drain_blob_queue(self, result: dict):
+        while True:
+            done, failed = self.process_blob_queue_chunk()
+            result['files_deleted'] += done
+            result['files_failed'] += failed
+            # Неудачные файлы остаются в очереди (в ее конце) до следующего запуска
+            if done + failed < self.chunk_size or done == 0:
+                break
+
+
+# Канал LISTEN/NOTIFY: при создании пасты со сроком жизни лидер узнает ее дедлайн
+EXPIRY_CHANNEL = 'paste_expiry'
+
+UPCOMING_DEADLINES_QUERY = text("""
+    SELECT id, expires_at FROM pastes
+    WHERE expires_at >= :now
+    ORDER BY expires_at
+    LIMIT :limit
+""")
+
+
+def notify_expiry(paste_id: int, expires_at: datetime):
+    """Сообщает лидеру очистки о новом дедлайне (доставляется после commit транзакции)"""
+    if expires_at is None:
+        return
+    db.session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {'channel': EXPIRY_CHANNEL, 'payload': f"{paste_id}:{_as_utc(expires_at).timestamp()}"}
+    )
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Значения без часового пояса в этом приложении всегда в UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+# Ключ advisory-блокировки лидера очистки (одинаковый во всех процессах и репликах)
+EXPIRY_LOCK_KEY = 0x50415354
+
+LOCK_HOLDER_QUERY = text("""
+    SELECT a.pid, a.application_name, a.client_addr::text AS client_addr, a.backend_start
+    FROM pg_locks l
+    JOIN pg_stat_activity a ON a.pid = l.pid
+    WHERE l.locktype = 'advisory' AND l.granted
+      AND l.classid = 0 AND l.objid = :key AND l.objsubid = 1
+""")
+
+
+class ExpiryWorker:
+    """Фоновая очистка истекших паст, выполняемая ровно одним процессом
+
+    Поток запускается в каждом воркере gunicorn (и в каждой реплике), но
+    очистку выполняет только лидер - процесс, удерживающий сессионную
+    advisory-блокировку Postgres на отдельном соединении. При завершении
+    лидера соединение закрывается, блокировка освобождается и ее забирает
+    один из ожидающих процессов (не позже чем через retry_interval секунд).
+
+    Лидер не опрашивает таблицу по таймеру, а спит до ближайшего дедлайна:
+    min-куча ближайших expires_at заполняется индексным запросом по возрастанию
+    expires_at и пополняется уведомлениями NOTIFY при создании паст. Раз в
+    interval секунд выполняется страховочная очистка и перечитывание кучи.
+
+    on_leadership - разовое обслуживание (досчет превью, поискового индекса),
+    которое новый лидер запускает в отдельном потоке, чтобы не задерживать очистку.
+    """
+
+    def __init__(self, app, engine: ExpiryEngine, interval: float = 300.0,
+                 retry_interval: float = 15.0, reconcile_interval: float = 600.0,
+                 lock_key: int = EXPIRY_LOCK_KEY, heap_size: int = 1000, on_leadership=None):
+        self.app = app
+        self.engine = engine
+        self.on_leadership = on_leadership
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.reconcile_interval = reconcile_interval
+        self.lock_key = lock_key
+        self.heap_size = heap_size
+        self._deadlines = []  # min-куча (expires_at, paste_id)
+        self._horizon = None  # Дедлайны позже этого в куче не хранятся (None - куча полная)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._connection = None
+        self.leader_since = None
+        self.last_run_at = None
+        self.last_result = None
+        self.last_error = None
+        self.maintenance_result = None
+        self.runs = 0
+        self.errors = 0
+        self.wakeups = 0
+        self.notifications = 0
+
+    def start(self):
+        """Запускает поток в текущем процессе (повторный вызов после fork запускает новый)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # Соединение, унаследованное от родительского процесса, не используем
+            self._connection = None
+            self.leader_since = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._connection is not None
+
+    def _try_acquire(self) -> bool:
+        """Пытается стать лидером, не блокируясь"""
+        connection = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {'key': self.lock_key}
+            ).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        # Уведомления слушаем на том же соединении, что держит блокировку
+        connection.execute(text(f"LISTEN {EXPIRY_CHANNEL}"))
+        self._connection = connection
+        self._deadlines = []
+        self._horizon = None
+        self.leader_since = datetime.now(timezone.utc)
+        print(f"Процесс {os.getpid()} стал лидером очистки истекших паст")
+        return True
+
+    def _check_leadership(self) -> bool:
+        """Проверяет, что соединение с блокировкой живо (иначе блокировка уже потеряна)"""
+        try:
+            self._connection.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            print(f"Потеряно соединение лидера очистки: {e}")
+            self._release()
+            return False
+
+    def _release(self):
+        connection, self._connection = self._connection, None
+        self.leader_since = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _refill(self, now: datetime):
+        """Загружает ближайшие дедлайны из БД (индекс по expires_at)"""
+        rows = db.session.execute(UPCOMING_DEADLINES_QUERY, {'now': now, 'limit': self.heap_size}).fetchall()
+        db.session.commit()
+        self._deadlines = [(_as_utc(row.expires_at), row.id) for row in rows]
+        heapq.heapify(self._deadlines)
+        # Строки отсортированы по expires_at, последняя - самый поздний загруженный дедлайн
+        self._horizon = _as_utc(rows[-1].expires_at) if len(rows) >= self.heap_size else None
+
+    def _push_deadline(self, paste_id: int, deadline: datetime):
+        # Дедлайны за горизонтом загрузятся при следующем перечитывании
+        if self._horizon is None or deadline <= self._horizon:
+            heapq.heappush(self._deadlines, (deadline, paste_id))
+
+    def _wait(self, timeout: float):
+        """Ждет уведомления NOTIFY не дольше timeout секунд"""
+        raw = self._connection.connection.dbapi_connection
+        if timeout > 0 and not raw.notifies:
+            select.select([raw], [], [], timeout)
+        raw.poll()
+        while raw.notifies:
+            notify = raw.notifies.pop(0)
+            self.notifications += 1
+            try:
+                paste_id, timestamp = notify.payload.split(':', 1)
+                self._push_deadline(int(paste_id), datetime.fromtimestamp(float(timestamp), timezone.utc))
+            except ValueError:
+                print(f"Некорректное уведомление об истечении: {notify.payload}")
+
+    def _expire(self):
+        result = self.engine.run_once()
+        self.runs += 1
+        self.last_run_at = datetime.now(timezone.utc)
+        self.last_result = result
+        if result['deleted'] or result['files_deleted'] or result['files_failed']:
+            print(f"✅ Удалено {result['deleted']} истекших паст, файлов: {result['files_deleted']}, "
+                  f"ошибок удаления файлов: {result['files_failed']}")
+
+    def _lead(self, last_reconcile: float) -> float:
+        """Цикл лидера: очистка к дедлайнам и страховочная очистка раз в interval секунд"""
+        next_sweep = 0.0
+        while self._check_leadership():
+            if time.monotonic() >= next_sweep:
+                # Страховочная очистка (пропущенные уведомления, пасты, истекшие до старта)
+                self._expire()
+                self._refill(datetime.now(timezone.utc))
+                next_sweep = time.monotonic() + self.interval
+
+            # Периодически сверяем инкрементальную статистику с таблицей pastes
+            if time.monotonic() - last_reconcile >= self.reconcile_interval:
+                last_reconcile = time.monotonic()
+                reconcile_stats()
+
+            now = datetime.now(timezone.utc)
+            timeout = next_sweep - time.monotonic()
+            if self._deadlines:
+                timeout = min(timeout, (self._deadlines[0][0] - now).total_seconds())
+            self._wait(max(timeout, 0))
+            self.wakeups += 1
+
+            now = datetime.now(timezone.utc)
+            due = False
+            while self._deadlines and self._deadlines[0][0] <= now:
+                heapq.heappop(self._deadlines)
+                due = True
+            if due:
+                # Одним запуском удаляются все пасты, чей срок уже наступил
+                self._expire()
+                if not self._deadlines and self._horizon is not None:
+                    self._refill(now)
+        return last_reconcile
+
+    def _run(self):
+        last_reconcile = time.monotonic()
+        while True:
+            try:
+                with self.app.app_context():
+                    if not self.is_leader:
+                        if not self._try_acquire():
+                            time.sleep(self.retry_interval)
+                            continue
+                        # Новый лидер сразу сверяет статистику: после деплоя счетчики могут быть неполными
+                        last_reconcile = float('-inf')
+                        self._start_maintenance()
+                    last_reconcile = self._lead(last_reconcile)
+
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"❌ Ошибка при очистке паст: {e}")
+                try:
+                    with self.app.app_context():
+                        db.session.rollback()
+                except Exception:
+                    pass
+                time.sleep(self.retry_interval)
+
+    def _start_maintenance(self):
+        if self.on_leadership is not None:
+            threading.Thread(target=self._maintain, daemon=True).start()
+
+    def _maintain(self):
+        # Задачи идемпотентны: при смене лидера во время работы повторный запуск безопасен
+        try:
+            with self.app.app_context():
+                self.maintenance_result = self.on_leadership()
+        except Exception as e:
+            self.maintenance_result = {'error': str(e)}
+            print(f"❌ Ошибка обслуживания при получении лидерства: {e}")
+            try:
+                with self.app.app_context():
+                    db.session.rollback()
+            except Exception:
+                pass
+
+    def status(self) -> dict:
+        """Состояние очистки: локальный процесс и текущий лидер по данным Postgres"""
+        status = {
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'running': self._thread is not None and self._pid == os.getpid() and self._thread.is_alive(),
+            'is_leader': self.is_leader,
+            'leader_since': self.leader_since.isoformat() if self.leader_since else None,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_result': self.last_result,
+            'runs': self.runs,
+            'wakeups': self.wakeups,
+            'notifications': self.notifications,
+            'pending_deadlines': len(self._deadlines),
+            'next_deadline': self._deadlines[0][0].isoformat() if self._deadlines else None,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'maintenance': self.maintenance_result,
+            'leader': None
+        }
+
+        # Ключ bigint хранится в pg_locks как (classid, objid); для ключей < 2^32 classid = 0
+        row = db.session.execute(LOCK_HOLDER_QUERY, {'key': self.lock_key}).first()
+        if row is not None:
+            status['leader'] = {
+                'backend_pid': row.pid,
+                'application_name': row.application_name,
+                'client_addr': row.client_addr,
+                'connected_since': row.backend_start.isoformat() if row.backend_start else None
+            }
+        return status
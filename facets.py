@@ -0,0 +1,73 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+
+from models import db, Paste
+
+# Фасет категорий: language -> число активных публичных паст.
+# Считается одним GROUP BY и кэшируется в памяти воркера на CATEGORY_FACETS_TTL
+# секунд (но не дольше ближайшего истечения пасты из результата).
+# Создание, удаление и истечение публичных паст сбрасывают кэш во всех воркерах
+# и репликах: по уведомлению из канала cache_invalidation.PUBLIC_PAGES_CHANNEL.
+# Пока соединение LISTEN воркера потеряно, свежесть ограничена только TTL.
+
+_facets = None
+_facets_valid_until = 0.0
+_facets_generation = 0  # Номер сброса: результат запроса, начатого до сброса, не кэшируется
+_facets_lock = threading.Lock()
+
+
+def invalidate_category_facets():
+    """Сбрасывает кэш фасета категорий текущего воркера"""
+    global _facets, _facets_generation
+    with _facets_lock:
+        _facets = None
+        _facets_generation += 1
+
+
+def get_category_facets(ttl: float = 30.0) -> dict:
+    """Категории активных публичных паст с количеством паст (из кэша или одним запросом)"""
+    global _facets, _facets_valid_until
+
+    with _facets_lock:
+        if _facets is not None and time.monotonic() < _facets_valid_until:
+            return dict(_facets)
+        generation = _facets_generation
+
+    rows = db.session.query(
+        Paste.language,
+        func.count(Paste.id),
+        func.min(Paste.expires_at)
+    ).filter(
+        Paste.not_expired_condition(),
+        Paste.is_private == False
+    ).group_by(Paste.language).all()
+
+    facets = {}
+    next_expiry = None
+    for language, count, expires_at in rows:
+        if language:
+            facets[language] = facets.get(language, 0) + count
+        if expires_at is not None and (next_expiry is None or expires_at < next_expiry):
+            next_expiry = expires_at
+
+    # Когда истечет первая паста, счетчики устареют - кэш живет не дольше этого
+    lifetime = ttl
+    if next_expiry is not None:
+        if next_expiry.tzinfo is None:
+            next_expiry = next_expiry.replace(tzinfo=timezone.utc)
+        lifetime = min(ttl, max((next_expiry - datetime.now(timezone.utc)).total_seconds(), 0))
+
+    with _facets_lock:
+        if generation == _facets_generation:
+            _facets = facets
+            _facets_valid_until = time.monotonic() + lifetime
+
+    return dict(facets)
+
+
+def category_list(facets: dict) -> list:
+    """Названия категорий для фильтров (по алфавиту)"""
+    return sorted(facets)
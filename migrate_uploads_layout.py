@@ -0,0 +1,36 @@
+"""Перенос файлов паст из плоского uploads/ в шардированную раскладку uploads/ab/cd/
+
+Запуск (приложение может продолжать работать):
+    python migrate_uploads_layout.py [--batch 1000] [--pause 0.1]
+"""
+import argparse
+import time
+
+from config import get_config
+from storage_simple import FileStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос uploads/ в шардированную раскладку')
+    parser.add_argument('--folder', default=get_config().UPLOAD_FOLDER, help='Каталог хранилища')
+    parser.add_argument('--batch', type=int, default=1000, help='Файлов за один проход')
+    parser.add_argument('--pause', type=float, default=0.1, help='Пауза между проходами, сек')
+    args = parser.parse_args()
+
+    storage = FileStorage(args.folder)
+    total_moved = 0
+
+    # Переносим порциями, чтобы не создавать длительную нагрузку на диск
+    while True:
+        moved = storage.migrate_to_sharded_layout(limit=args.batch)
+        total_moved += moved
+        print(f"Перенесено файлов: {total_moved}")
+        if moved < args.batch:
+            break
+        time.sleep(args.pause)
+
+    print(f"✅ Миграция завершена, всего перенесено: {total_moved}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from datetime import datetime, timezone
+import os
 import uuid
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+
+# Сессия с маршрутизацией чтения на реплики (см. db_routing.py) - только если
+# реплики заданы; без них get_bind не перехватывается
+db = SQLAlchemy(session_options={'class_': RoutingSession} if os.getenv('DATABASE_REPLICA_URLS', '').strip() else {})
 
 class Paste(db.Model):
     __tablename__ = 'pastes'
@@ -11,6 +17,9 @@ class Paste(db.Model):
     uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
     title = db.Column(db.String(255), nullable=False)
     content_hash = db.Column(db.String(64), nullable=False)
+    # Содержимое небольших паст хранится в строке (см. INLINE_CONTENT_MAX_BYTES), у остальных - NULL.
+    # Отложенная загрузка: списки паст его не читают, страницы пасты запрашивают через undefer
+    content = db.deferred(db.Column(db.Text, nullable=True))
     language = db.Column(db.String(50), default='text')
     lifetime = db.Column(db.Float, default=1440)
     is_private = db.Column(db.Boolean, default=False)
@@ -22,6 +31,11 @@ class Paste(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     tags = db.Column(db.ARRAY(db.String), default=[])  # Массив строк для тегов
     
+    # Превью для списков паст (вычисляется при создании, см. previews.py)
+    preview = db.Column(db.Text)  # Первые строки содержимого
+    line_count = db.Column(db.Integer)
+    size_bytes = db.Column(db.Integer)
+    
     def __repr__(self):
         return f'<Paste {self.id}: {self.title}>'
     
@@ -39,9 +53,27 @@ class Paste(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
             'is_expired': self.is_expired,
-            'tags': self.tags
+            'tags': self.tags,
+            'line_count': self.line_count,
+            'size_bytes': self.size_bytes
         }
     
+    @staticmethod
+    def not_expired_condition():
+        """SQL-условие "паста не истекла": срок проверяется в самом запросе
+
+        Обработчики чтения ничего не пишут в БД - истекшие пасты удаляет
+        (и при необходимости помечает) только фоновая очистка.
+        """
+        return db.and_(
+            Paste.is_expired == False,
+            db.or_(Paste.expires_at.is_(None), Paste.expires_at > db.func.now())
+        )
+    
+    def has_expired(self) -> bool:
+        """Истекла ли паста (без изменения флага is_expired)"""
+        return bool(self.is_expired or (self.expires_at and self.expires_at <= datetime.now(timezone.utc)))
+    
     def get_remaining_time(self):
         """Возвращает оставшееся время жизни пасты в минутах"""
         if self.lifetime == 0 or not self.expires_at:
@@ -155,3 +187,28 @@ class AppStats(db.Model):
     
     def __repr__(self):
         return f'<AppStats {self.key}: {self.value}>'
+
+class PasteSearchIndex(db.Model):
+    __tablename__ = 'paste_search_index'
+    
+    # Строка индекса удаляется вместе с пастой (ON DELETE CASCADE)
+    paste_id = db.Column(db.Integer, db.ForeignKey('pastes.id', ondelete='CASCADE'), primary_key=True)
+    document = db.Column(db.Text, nullable=False)  # Название + содержимое для триграммного поиска
+    search_vector = db.Column(TSVECTOR)  # Название + начало содержимого для полнотекстового поиска
+    indexed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def __repr__(self):
+        return f'<PasteSearchIndex {self.paste_id}>'
+
+class ExpiredBlob(db.Model):
+    __tablename__ = 'expired_blob_queue'
+    
+    # Очередь файлов удаленных паст: строка добавляется в той же транзакции,
+    # что и удаление пасты, и удаляется после удаления файлов из хранилища
+    paste_id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    queued_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Неудачные попытки удаления
+    
+    def __repr__(self):
+        return f'<ExpiredBlob {self.paste_id}>'
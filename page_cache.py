@@ -0,0 +1,72 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class PageCache:
+    """Кэш готового HTML публичных страниц (главная, первая страница /recent)
+
+    Живет в памяти воркера. Запись устаревает через ttl секунд, но не позже
+    истечения первой из показанных на странице паст, и сбрасывается явно при
+    создании, удалении и истечении публичных паст - во всех воркерах, по
+    уведомлению (cache_invalidation). Страницы с flash-сообщениями
+    в кэш не попадают и из него не отдаются - сообщения остаются у своего пользователя.
+    """
+
+    def __init__(self, ttl: float = 10.0):
+        self.ttl = ttl
+        self._pages = {}
+        self._lock = threading.Lock()
+        # Номер сброса: страница, отрендеренная до сброса, в кэш уже не попадет
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, html: str, expires_at_values=(), generation: int = None):
+        """Сохраняет страницу; expires_at_values - сроки жизни показанных паст
+
+        generation - значение self.generation до начала рендеринга: если кэш за это
+        время сбросили, страница могла устареть и не сохраняется.
+        """
+        if self.ttl <= 0:
+            return
+        lifetime = self.ttl
+        now = datetime.now(timezone.utc)
+        for expires_at in expires_at_values:
+            if expires_at is None:
+                continue
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            lifetime = min(lifetime, (expires_at - now).total_seconds())
+        if lifetime <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._pages[key] = (html, time.monotonic() + lifetime)
+
+    def invalidate(self):
+        """Сбрасывает все страницы (меняется набор публичных паст)"""
+        with self._lock:
+            self._pages.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._pages),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+# Keyset-пагинация: страница выбирается условием по ключу сортировки последней
+# строки предыдущей страницы, а не OFFSET, поэтому стоимость запроса зависит
+# только от размера страницы, а не от размера таблицы.
+# Все ключи сортировки предполагаются убывающими (DESC).
+
+
+def encode_cursor(values) -> str:
+    """Кодирует значения ключа сортировки в непрозрачный токен курсора"""
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'dt': value.isoformat()})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, expected_length: int):
+    """Декодирует токен курсора. Возвращает None для пустого или некорректного токена"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(payload, list) or len(payload) != expected_length:
+            return None
+        values = []
+        for value in payload:
+            if isinstance(value, dict) and 'dt' in value:
+                values.append(datetime.fromisoformat(value['dt']))
+            else:
+                values.append(value)
+        return values
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_page_size(raw_value, default: int, maximum: int) -> int:
+    """Ограничивает запрошенный размер страницы диапазоном [1, maximum]"""
+    try:
+        page_size = int(raw_value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, maximum))
+
+
+def keyset_page(query, sort_columns: list, cursor: str, page_size: int, key_getter):
+    """Возвращает (строки страницы, курсор следующей страницы или None)
+
+    query        - запрос без ORDER BY/LIMIT
+    sort_columns - выражения ключа сортировки (последним должен идти уникальный id)
+    key_getter   - функция, извлекающая значения ключа из строки результата
+    """
+    cursor_values = decode_cursor(cursor, len(sort_columns))
+    if cursor_values is not None:
+        query = query.filter(tuple_(*sort_columns) < tuple_(*cursor_values))
+
+    rows = query.order_by(*[column.desc() for column in sort_columns]).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(key_getter(rows[-1]))
+
+    return rows, next_cursor
@@ -0,0 +1,63 @@
+from flask import current_app
+
+from models import db, Paste
+
+# Превью пасты (начало содержимого, число строк, размер) хранится в строке pastes
+# и вычисляется один раз при создании, поэтому страницы со списками паст
+# не читают содержимое из хранилища.
+
+
+def build_preview(content: str, max_lines: int = 10, max_chars: int = 500) -> dict:
+    """Вычисляет превью: первые max_lines строк, но не больше max_chars символов"""
+    content = content or ''
+    preview = '\n'.join(content.split('\n', max_lines)[:max_lines])[:max_chars]
+    return {
+        'preview': preview,
+        'line_count': content.count('\n') + 1 if content else 0,
+        'size_bytes': len(content.encode('utf-8'))
+    }
+
+
+def apply_preview(paste: Paste, content: str):
+    """Заполняет поля превью пасты (в текущей транзакции)"""
+    projection = build_preview(
+        content,
+        current_app.config.get('PREVIEW_MAX_LINES', 10),
+        current_app.config.get('PREVIEW_MAX_CHARS', 500)
+    )
+    paste.preview = projection['preview']
+    paste.line_count = projection['line_count']
+    paste.size_bytes = projection['size_bytes']
+
+
+def backfill_previews(storage, batch_size: int = 200) -> int:
+    """Вычисляет превью для паст, созданных до появления этих полей"""
+    filled_count = 0
+    last_id = 0
+    while True:
+        pastes = Paste.query.options(db.undefer(Paste.content)).filter(
+            Paste.size_bytes.is_(None),
+            Paste.id > last_id
+        ).order_by(Paste.id).limit(batch_size).all()
+
+        if not pastes:
+            break
+
+        # Содержимое порции читается одним пакетом (для MinIO - параллельно)
+        contents = storage.get_paste_contents([
+            (paste.id, paste.content_hash) for paste in pastes if paste.content is None
+        ])
+        for paste in pastes:
+            try:
+                content = paste.content if paste.content is not None else contents.get(paste.id)
+                if content is None:
+                    continue
+                apply_preview(paste, content)
+                filled_count += 1
+            except Exception as e:
+                print(f"Ошибка вычисления превью пасты {paste.id}: {e}")
+
+        last_id = pastes[-1].id
+        db.session.commit()
+
+    return filled_count
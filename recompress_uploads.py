@@ -0,0 +1,55 @@
+"""Фоновое пересжатие старых (несжатых) паст текущим кодеком хранилища
+
+Запуск (приложение может продолжать работать):
+    python recompress_uploads.py [--batch 500] [--pause 1.0] [--minio] [--start-after PATH]
+
+Каждый проход продолжает обход с места, где остановился предыдущий. После
+прерывания запуск можно продолжить с последнего выведенного курсора (--start-after).
+"""
+import argparse
+import time
+
+from config import get_config
+
+
+def main():
+    config = get_config()
+    parser = argparse.ArgumentParser(description='Пересжатие содержимого паст')
+    parser.add_argument('--folder', default=config.UPLOAD_FOLDER, help='Каталог FileStorage')
+    parser.add_argument('--minio', action='store_true', help='Пересжать объекты MinIO вместо файлов')
+    parser.add_argument('--batch', type=int, default=500, help='Файлов, читаемых целиком за один проход')
+    parser.add_argument('--pause', type=float, default=1.0, help='Пауза между проходами, сек')
+    parser.add_argument('--start-after', default=None, help='Курсор: продолжить после этого файла/объекта')
+    args = parser.parse_args()
+
+    if args.minio:
+        from storage import MinioStorage
+        storage = MinioStorage()
+        recompress = storage.recompress_objects
+    else:
+        from storage_simple import FileStorage
+        storage = FileStorage(args.folder, codec=config.STORAGE_COMPRESSION,
+                              compress_min_bytes=config.COMPRESSION_MIN_BYTES)
+        recompress = storage.recompress_files
+
+    print(f"Кодек: {storage.codec}")
+    totals = {'files': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0}
+    cursor = args.start_after
+
+    # Обрабатываем порциями, чтобы не загружать CPU и диск надолго
+    while True:
+        result = recompress(limit=args.batch, start_after=cursor)
+        for key in totals:
+            totals[key] += result[key]
+        print(f"Пересжато файлов: {totals['files']} (несжимаемых: {totals['skipped']}), "
+              f"{totals['bytes_before']} -> {totals['bytes_after']} байт, курсор: {result['cursor']}")
+        if result['cursor'] is None or result['cursor'] == cursor:
+            break
+        cursor = result['cursor']
+        time.sleep(args.pause)
+
+    print("✅ Пересжатие завершено")
+
+
+if __name__ == '__main__':
+    main()
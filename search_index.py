@@ -0,0 +1,281 @@
+from flask import current_app
+from sqlalchemy import text, case, func, cast, not_, Integer
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from datetime import datetime, timezone
+
+from models import db, Paste, PasteSearchIndex
+from pagination import decode_cursor, encode_cursor, keyset_page
+
+# Триграммный индекс по таблице paste_search_index.
+# pg_trgm позволяет GIN-индексу отвечать на ILIKE '%...%' без полного сканирования,
+# поэтому поиск не читает файлы из uploads/ и не перебирает все пасты в Python.
+#
+# Второй режим - полнотекстовый: колонка search_vector (tsvector из названия и
+# начала содержимого) с GIN-индексом, запрос websearch_to_tsquery и ранжирование
+# ts_rank. Язык словаря задается SEARCH_FTS_LANGUAGE; после его смены векторы
+# нужно пересчитать (UPDATE paste_search_index SET search_vector = NULL и перезапуск).
+
+SEARCH_MODES = ('substring', 'fts')
+
+
+def ensure_search_index():
+    """Создает расширение pg_trgm и GIN-индекс (для db.create_all без миграций)"""
+    try:
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_paste_search_document_trgm "
+            "ON paste_search_index USING gin (document gin_trgm_ops)"
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Не удалось создать триграммный индекс: {e}")
+
+    try:
+        db.session.execute(text("ALTER TABLE paste_search_index ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_paste_search_vector "
+            "ON paste_search_index USING gin (search_vector)"
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Не удалось создать полнотекстовый индекс: {e}")
+
+    try:
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_pastes_title_prefix "
+            "ON pastes (lower(title) text_pattern_ops)"
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Не удалось создать индекс префиксов названий: {e}")
+
+
+def build_search_vector(title: str, content: str):
+    """SQL-выражение tsvector: название (вес A) и начало содержимого (вес B)"""
+    language = cast(current_app.config.get('SEARCH_FTS_LANGUAGE', 'russian'), REGCONFIG)
+    max_chars = current_app.config.get('SEARCH_FTS_MAX_CHARS', 100 * 1024)
+    return func.setweight(func.to_tsvector(language, title or ''), 'A').op('||')(
+        func.setweight(func.to_tsvector(language, (content or '')[:max_chars]), 'B')
+    )
+
+
+def backfill_search_vectors(batch_size: int = 500) -> int:
+    """Заполняет search_vector для строк индекса, созданных до его появления"""
+    language = current_app.config.get('SEARCH_FTS_LANGUAGE', 'russian')
+    max_chars = current_app.config.get('SEARCH_FTS_MAX_CHARS', 100 * 1024)
+    filled_count = 0
+    while True:
+        # Документ - это "название\nсодержимое", название берем из pastes
+        result = db.session.execute(text("""
+            UPDATE paste_search_index AS i
+            SET search_vector =
+                setweight(to_tsvector(CAST(:language AS regconfig), coalesce(p.title, '')), 'A') ||
+                setweight(to_tsvector(CAST(:language AS regconfig),
+                    left(substr(i.document, char_length(coalesce(p.title, '')) + 2), :max_chars)), 'B')
+            FROM pastes p
+            WHERE p.id = i.paste_id
+              AND i.paste_id IN (
+                  SELECT paste_id FROM paste_search_index
+                  WHERE search_vector IS NULL
+                  LIMIT :limit
+              )
+        """), {'language': language, 'max_chars': max_chars, 'limit': batch_size})
+        db.session.commit()
+        filled_count += result.rowcount
+        if result.rowcount < batch_size:
+            return filled_count
+
+
+def build_document(title: str, content: str) -> str:
+    """Формирует индексируемый документ из названия и содержимого"""
+    max_chars = current_app.config.get('SEARCH_INDEX_MAX_CHARS', 1024 * 1024)
+    return f"{title or ''}\n{(content or '')[:max_chars]}"
+
+
+def index_paste(paste: Paste, content: str):
+    """Добавляет (или обновляет) пасту в поисковом индексе в текущей транзакции"""
+    # Приватные пасты в поиске не участвуют, индексировать их незачем
+    if paste.is_private:
+        return
+
+    entry = db.session.get(PasteSearchIndex, paste.id)
+    if entry is None:
+        entry = PasteSearchIndex(paste_id=paste.id)
+        db.session.add(entry)
+    entry.document = build_document(paste.title, content)
+    entry.search_vector = build_search_vector(paste.title, content)
+    entry.indexed_at = datetime.now(timezone.utc)
+
+
+def _escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# pg_trgm не извлекает триграммы из слов короче трех символов: условие ILIKE по ним
+# не сужает GIN-индекс и превращается в полный проход по нему. Такие слова
+# проверяются через strpos(), который индексом не обслуживается, - это перепроверка
+# строк, уже отобранных по длинным словам
+MIN_TOKEN_CHARS = 3
+
+
+def _token_condition(token: str):
+    """Условие "слово встречается в документе" (без учета регистра)"""
+    if len(token) >= MIN_TOKEN_CHARS:
+        return PasteSearchIndex.document.ilike(f"%{_escape_like(token)}%", escape='\\')
+    return func.strpos(func.lower(PasteSearchIndex.document), token.lower()) > 0
+
+
+def search_paste_page(search_query: str, category: str = None, cursor: str = None, page_size: int = None):
+    """Возвращает (id публичных активных паст по релевантности, курсор следующей страницы)
+
+    Каждое слово запроса должно встречаться в названии или содержимом (подстрока,
+    без учета регистра). Выше ранжируются пасты, где совпадает вся фраза в названии,
+    затем по сходству названия с запросом и по дате создания.
+
+    Если в запросе нет слов длиной от MIN_TOKEN_CHARS, триграммный индекс
+    бесполезен. Тогда первыми идут пасты, название которых начинается с запроса:
+    их находит индекс idx_pastes_title_prefix, и остальные пасты читаются только
+    когда страница ими не заполнилась.
+    """
+    search_query = (search_query or '').strip()
+    if not search_query:
+        return [], None
+
+    if page_size is None:
+        page_size = current_app.config.get('SEARCH_RESULTS_LIMIT', 100)
+
+    phrase_pattern = f"%{_escape_like(search_query)}%"
+    tokens = search_query.split()
+
+    # Ключ ранжирования целочисленный, чтобы курсор сравнивался точно
+    title_match = case((Paste.title.ilike(phrase_pattern, escape='\\'), 1), else_=0)
+    title_similarity = cast(func.similarity(Paste.title, search_query) * 1000, Integer)
+    sort_columns = [title_match, title_similarity, Paste.created_at, Paste.id]
+
+    query = db.session.query(Paste.id, *sort_columns[:-1]).join(
+        PasteSearchIndex, PasteSearchIndex.paste_id == Paste.id
+    ).filter(
+        Paste.not_expired_condition(),
+        Paste.is_private == False,
+        *[_token_condition(token) for token in tokens]
+    )
+
+    if category:
+        query = query.filter(Paste.language == category)
+
+    if any(len(token) >= MIN_TOKEN_CHARS for token in tokens):
+        rows, next_cursor = keyset_page(
+            query, sort_columns, cursor, page_size,
+            key_getter=lambda row: [row[1], row[2], row[3], row[0]]
+        )
+        return [row[0] for row in rows], next_cursor
+
+    return _search_by_title_prefix_first(query, search_query, sort_columns, cursor, page_size)
+
+
+def _search_by_title_prefix_first(query, search_query: str, sort_columns: list, cursor: str, page_size: int):
+    """Страница поиска без длинных слов: сначала пасты с названием-префиксом, затем остальные
+
+    Совпадение префикса - старший ключ сортировки, поэтому курсор первой части
+    меньше любого курсора второй, и одна keyset-страница может начаться в первой
+    части и закончиться во второй.
+    """
+    title_prefix = func.lower(Paste.title).like(f"{_escape_like(search_query.lower())}%", escape='\\')
+    sort_columns = [case((title_prefix, 1), else_=0)] + sort_columns
+    query = query.add_columns(sort_columns[0])
+
+    def key_getter(row):
+        return [row[4], row[1], row[2], row[3], row[0]]
+
+    cursor_values = decode_cursor(cursor, len(sort_columns))
+    rows = []
+    if cursor_values is None or cursor_values[0] == 1:
+        # Индексный доступ: по idx_pastes_title_prefix, слова перепроверяются на найденных строках
+        rows, next_cursor = keyset_page(query.filter(title_prefix), sort_columns, cursor, page_size, key_getter)
+        if next_cursor is not None:
+            return [row[0] for row in rows], next_cursor
+
+    rest_query = query.filter(not_(func.coalesce(title_prefix, False)))
+    remaining = page_size - len(rows)
+    if remaining == 0:
+        next_cursor = encode_cursor(key_getter(rows[-1])) if rest_query.first() is not None else None
+        return [row[0] for row in rows], next_cursor
+
+    rest_rows, next_cursor = keyset_page(rest_query, sort_columns, cursor, remaining, key_getter)
+    return [row[0] for row in rows + rest_rows], next_cursor
+
+
+def search_paste_page_fts(search_query: str, category: str = None, cursor: str = None, page_size: int = None):
+    """Полнотекстовый поиск: (id публичных активных паст по ts_rank, курсор следующей страницы)
+
+    Запрос разбирается websearch_to_tsquery ("фраза в кавычках", or, -исключение),
+    слова сравниваются по основам словаря SEARCH_FTS_LANGUAGE. Совпадения в
+    названии весят больше, чем в содержимом.
+    """
+    if not search_query:
+        return [], None
+
+    if page_size is None:
+        page_size = current_app.config.get('SEARCH_RESULTS_LIMIT', 100)
+
+    language = cast(current_app.config.get('SEARCH_FTS_LANGUAGE', 'russian'), REGCONFIG)
+    ts_query = func.websearch_to_tsquery(language, search_query)
+
+    # Ранг целочисленный, чтобы курсор сравнивался точно
+    rank = cast(func.ts_rank(PasteSearchIndex.search_vector, ts_query) * 1000000, Integer)
+    sort_columns = [rank, Paste.created_at, Paste.id]
+
+    query = db.session.query(Paste.id, *sort_columns[:-1]).join(
+        PasteSearchIndex, PasteSearchIndex.paste_id == Paste.id
+    ).filter(
+        PasteSearchIndex.search_vector.op('@@')(ts_query),
+        Paste.not_expired_condition(),
+        Paste.is_private == False
+    )
+
+    if category:
+        query = query.filter(Paste.language == category)
+
+    rows, next_cursor = keyset_page(
+        query, sort_columns, cursor, page_size,
+        key_getter=lambda row: [row[1], row[2], row[0]]
+    )
+    return [row[0] for row in rows], next_cursor
+
+
+def rebuild_search_index(storage, batch_size: int = 500) -> int:
+    """Индексирует публичные пасты, которых еще нет в индексе (для существующих данных)"""
+    indexed_count = 0
+    last_id = 0
+    while True:
+        pastes = Paste.query.options(db.undefer(Paste.content)).outerjoin(
+            PasteSearchIndex, PasteSearchIndex.paste_id == Paste.id
+        ).filter(
+            PasteSearchIndex.paste_id.is_(None),
+            Paste.is_private == False,
+            Paste.id > last_id
+        ).order_by(Paste.id).limit(batch_size).all()
+
+        if not pastes:
+            break
+
+        # Содержимое порции читается одним пакетом (для MinIO - параллельно)
+        contents = storage.get_paste_contents([
+            (paste.id, paste.content_hash) for paste in pastes if paste.content is None
+        ])
+        for paste in pastes:
+            try:
+                content = paste.content if paste.content is not None else contents.get(paste.id)
+                index_paste(paste, content or '')
+                indexed_count += 1
+            except Exception as e:
+                print(f"Ошибка индексации пасты {paste.id}: {e}")
+
+        last_id = pastes[-1].id
+        db.session.commit()
+
+    return indexed_count
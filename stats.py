@@ -0,0 +1,226 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Paste, AppStats
+
+# Статистика публичных паст поддерживается инкрементально в app_stats:
+# счетчики меняются в той же транзакции, что создание/истечение/удаление пасты,
+# а страницы читают их одним запросом (и из короткоживущего снимка в памяти).
+# reconcile_stats() периодически пересчитывает значения по таблице pastes.
+
+STAT_TOTAL_EVER = 'total_pastes_ever'
+STAT_ACTIVE = 'active_public_pastes'
+STAT_EXPIRED = 'expired_public_pastes'  # Публичные пасты, удаленные очисткой по сроку (нарастающим итогом)
+CREATED_PREFIX = 'public_created:'    # Публичные пасты по дням создания (UTC)
+LANGUAGE_PREFIX = 'public_language:'  # Публичные пасты по категориям
+
+WEEK_DAYS = 7
+
+_snapshot = None
+_snapshot_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def _utc_date(value: datetime):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _created_key(created_at: datetime) -> str:
+    return f"{CREATED_PREFIX}{_utc_date(created_at).isoformat()}"
+
+
+def _language_key(language: str) -> str:
+    return f"{LANGUAGE_PREFIX}{language or 'text'}"
+
+
+def increment_counters(deltas: dict):
+    """Атомарно увеличивает счетчики одним INSERT ... ON CONFLICT DO UPDATE
+
+    Выполняется в транзакции вызывающего кода (без commit), поэтому счетчики
+    фиксируются вместе с изменением, которое они описывают. Ключи упорядочены,
+    чтобы параллельные транзакции блокировали строки в одном порядке.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {'key': key, 'value': delta, 'updated_at': now}
+        for key, delta in sorted(deltas.items()) if delta
+    ]
+    if not rows:
+        return
+
+    statement = insert(AppStats).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[AppStats.key],
+        set_={
+            'value': func.coalesce(AppStats.value, 0) + statement.excluded.value,
+            'updated_at': statement.excluded.updated_at
+        }
+    )
+    db.session.execute(statement)
+    invalidate_snapshot()
+
+
+def set_counters(values: dict, only_missing: bool = False):
+    """Устанавливает абсолютные значения счетчиков одним UPSERT (в транзакции вызывающего кода)
+
+    only_missing=True - только создает отсутствующие счетчики, существующие не трогает.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [{'key': key, 'value': value, 'updated_at': now} for key, value in sorted(values.items())]
+    if not rows:
+        return
+
+    statement = insert(AppStats).values(rows)
+    if only_missing:
+        statement = statement.on_conflict_do_nothing(index_elements=[AppStats.key])
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=[AppStats.key],
+            set_={'value': statement.excluded.value, 'updated_at': statement.excluded.updated_at},
+            where=AppStats.value.is_distinct_from(statement.excluded.value)
+        )
+    db.session.execute(statement)
+    invalidate_snapshot()
+
+
+def get_counter(key: str, default_value: int = 0) -> int:
+    """Значение счетчика по ключу"""
+    value = db.session.query(AppStats.value).filter(AppStats.key == key).scalar()
+    return value if value is not None else default_value
+
+
+def record_paste_created(paste: Paste):
+    """Учитывает созданную пасту (общий счетчик - для всех, остальные - только для публичных)"""
+    deltas = {STAT_TOTAL_EVER: 1}
+    if not paste.is_private:
+        deltas.update({
+            STAT_ACTIVE: 1,
+            _created_key(paste.created_at or datetime.now(timezone.utc)): 1,
+            _language_key(paste.language): 1
+        })
+    increment_counters(deltas)
+
+
+def paste_deleted_deltas(is_private: bool, is_expired: bool, language: str, created_at: datetime,
+                         by_expiry: bool = False) -> dict:
+    """Изменения счетчиков при удалении пасты с указанными свойствами
+
+    by_expiry=True - пасту удалила очистка по сроку, она учитывается в STAT_EXPIRED.
+    """
+    if is_private:
+        return {}
+    deltas = {_language_key(language): -1}
+    # Флаг is_expired больше не выставляется; строки со старым флагом в активных не числятся
+    if not is_expired:
+        deltas[STAT_ACTIVE] = -1
+    if by_expiry:
+        deltas[STAT_EXPIRED] = 1
+    # Дневные корзины старше недели не хранятся (см. reconcile_stats)
+    if created_at and _utc_date(created_at) > datetime.now(timezone.utc).date() - timedelta(days=WEEK_DAYS + 1):
+        deltas[_created_key(created_at)] = -1
+    return deltas
+
+
+def merge_deltas(total: dict, deltas: dict) -> dict:
+    """Складывает изменения счетчиков (для пакетного учета)"""
+    for key, delta in deltas.items():
+        total[key] = total.get(key, 0) + delta
+    return total
+
+
+def record_paste_deleted(paste: Paste):
+    """Учитывает удаленную пасту"""
+    increment_counters(paste_deleted_deltas(paste.is_private, paste.is_expired, paste.language, paste.created_at))
+
+
+def invalidate_snapshot():
+    """Сбрасывает снимок статистики текущего воркера"""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def get_page_stats(ttl: float = 5.0) -> dict:
+    """Статистика для главной страницы и /recent одним запросом к app_stats"""
+    global _snapshot, _snapshot_at
+
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _snapshot_at < ttl:
+            return dict(_snapshot)
+
+    rows = db.session.query(AppStats.key, AppStats.value).filter(or_(
+        AppStats.key.in_([STAT_TOTAL_EVER, STAT_ACTIVE, STAT_EXPIRED]),
+        AppStats.key.like(f"{CREATED_PREFIX}%"),
+        AppStats.key.like(f"{LANGUAGE_PREFIX}%")
+    )).all()
+    values = {key: value or 0 for key, value in rows}
+
+    # "За неделю" считается с точностью до дня: сегодня и 6 предыдущих дней (UTC)
+    today = datetime.now(timezone.utc).date()
+    week_keys = {f"{CREATED_PREFIX}{(today - timedelta(days=offset)).isoformat()}" for offset in range(WEEK_DAYS)}
+
+    stats = {
+        'total_pastes': values.get(STAT_TOTAL_EVER, 0),
+        'active_pastes': max(values.get(STAT_ACTIVE, 0), 0),
+        'expired_pastes': max(values.get(STAT_EXPIRED, 0), 0),
+        'pastes_this_week': max(sum(values.get(key, 0) for key in week_keys), 0),
+        'categories': sum(1 for key, value in values.items() if key.startswith(LANGUAGE_PREFIX) and value > 0)
+    }
+
+    with _snapshot_lock:
+        _snapshot = stats
+        _snapshot_at = time.monotonic()
+
+    return dict(stats)
+
+
+def reconcile_stats():
+    """Пересчитывает счетчики по таблице pastes, исправляя накопившееся расхождение"""
+    now = datetime.now(timezone.utc)
+    public = Paste.query.filter(Paste.is_private == False)
+
+    active = public.filter(Paste.is_expired == False).count()
+
+    # Дневные корзины храним только за последнюю неделю (с запасом в один день)
+    since = now - timedelta(days=WEEK_DAYS + 1)
+    created_counts = {}
+    for created_at, in db.session.query(Paste.created_at).filter(
+        Paste.is_private == False,
+        Paste.created_at >= since
+    ).yield_per(1000):
+        key = _created_key(created_at)
+        created_counts[key] = created_counts.get(key, 0) + 1
+
+    language_counts = {}
+    for language, count in db.session.query(Paste.language, func.count(Paste.id)).filter(
+        Paste.is_private == False
+    ).group_by(Paste.language).all():
+        key = _language_key(language)
+        language_counts[key] = language_counts.get(key, 0) + count
+
+    set_counters({STAT_ACTIVE: active, **created_counts, **language_counts})
+    # Общий счетчик только инициализируется: удаленные пасты в нем остаются
+    if get_counter(STAT_TOTAL_EVER, None) is None:
+        set_counters({STAT_TOTAL_EVER: Paste.query.count()}, only_missing=True)
+    # Число истекших - история удалений, по таблице pastes его не пересчитать
+    set_counters({STAT_EXPIRED: 0}, only_missing=True)
+
+    # Удаляем устаревшие корзины и категории, которых больше нет
+    stale_keys = [
+        key for key, in db.session.query(AppStats.key).filter(or_(
+            AppStats.key.like(f"{CREATED_PREFIX}%"),
+            AppStats.key.like(f"{LANGUAGE_PREFIX}%")
+        )).all()
+        if key not in created_counts and key not in language_counts
+    ]
+    if stale_keys:
+        AppStats.query.filter(AppStats.key.in_(stale_keys)).delete(synchronize_session=False)
+
+    db.session.commit()
+    invalidate_snapshot()
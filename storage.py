@@ -1,11 +1,69 @@
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
+from concurrent.futures import ThreadPoolExecutor
+import codecs
 import hashlib
-import json
 import os
 import io
+import threading
 from datetime import datetime
 
+import certifi
+import urllib3
+
+import compression
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def shared_http_client() -> urllib3.PoolManager:
+    """Общий пул HTTP-соединений к MinIO для всех экземпляров MinioStorage процесса
+
+    Размер пула рассчитан на параллельные запросы (MINIO_POOL_SIZE), block=True -
+    при исчерпании пула запрос ждет свободное соединение, а не открывает лишнее.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            timeout = float(os.getenv('MINIO_TIMEOUT', 30))
+            _http_client = urllib3.PoolManager(
+                num_pools=4,
+                maxsize=int(os.getenv('MINIO_POOL_SIZE', 32)),
+                block=True,
+                timeout=urllib3.Timeout(connect=min(timeout, 5), read=timeout),
+                cert_reqs='CERT_REQUIRED',
+                ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+                retries=urllib3.Retry(
+                    total=3,
+                    backoff_factor=0.2,
+                    status_forcelist=[500, 502, 503, 504]
+                )
+            )
+        return _http_client
+
+
+class _ChunkReader:
+    """Файлоподобная обертка над итератором порций байтов (для put_object с length=-1)"""
+    
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+    
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
 class MinioStorage:
     def __init__(self):
         """Инициализация MinIO клиента"""
@@ -13,9 +71,21 @@ class MinioStorage:
             os.getenv('MINIO_ENDPOINT', 'localhost:9000'),
             access_key=os.getenv('MINIO_ACCESS_KEY', 'minioadmin'),
             secret_key=os.getenv('MINIO_SECRET_KEY', 'minioadmin123'),
-            secure=os.getenv('MINIO_SECURE', 'false').lower() == 'true'
+            secure=os.getenv('MINIO_SECURE', 'false').lower() == 'true',
+            http_client=shared_http_client()
         )
         self.bucket_name = os.getenv('MINIO_BUCKET_NAME', 'pastes')
+        # Параллельные чтения (get_paste_contents) - не больше io_workers запросов одновременно
+        self.io_workers = int(os.getenv('MINIO_IO_WORKERS', 8))
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        # Сжатие содержимого (zstd/gzip); кодек записывается в заголовок объекта
+        self.codec = compression.resolve_codec(os.getenv('STORAGE_COMPRESSION', 'auto'))
+        self.compress_min_bytes = int(os.getenv('COMPRESSION_MIN_BYTES', compression.DEFAULT_MIN_BYTES))
+        # Размер части multipart-загрузки (не меньше 5 МБ по требованиям S3); содержимое
+        # больше части загружается потоком, и в памяти одновременно находится одна часть
+        self.part_size = max(int(os.getenv('MINIO_PART_SIZE', 8 * 1024 * 1024)), 5 * 1024 * 1024)
         self._ensure_bucket_exists()
     
     def _ensure_bucket_exists(self):
@@ -31,6 +101,12 @@ class MinioStorage:
     
     def save_paste_content(self, paste_id: int, content: str) -> str:
         """Сохраняет содержимое пасты и возвращает хеш"""
+        # part_size - в байтах; len(content) * 4 - верхняя граница размера в UTF-8,
+        # посчитанная без копии строки в байтах
+        if len(content) * 4 >= self.part_size:
+            # Большое содержимое - потоком, без полных копий в байтах и сжатом виде
+            return self.save_paste_content_stream(paste_id, content)
+        
         try:
             # Создаем хеш содержимого
             content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
@@ -38,9 +114,10 @@ class MinioStorage:
             # Путь к файлу в bucket
             object_name = f"{paste_id}/content.txt"
             
-            # Создаем BytesIO объект для MinIO
-            content_bytes = content.encode('utf-8')
+            # Создаем BytesIO объект для MinIO (содержимое сжимается, если это выгодно)
+            content_bytes = compression.encode(content, self.codec, self.compress_min_bytes)
             content_stream = io.BytesIO(content_bytes)
+            is_compressed = compression.stored_codec(content_bytes) != 'none'
             
             # Загружаем содержимое
             self.client.put_object(
@@ -48,7 +125,7 @@ class MinioStorage:
                 object_name,
                 content_stream,
                 length=len(content_bytes),
-                content_type='text/plain'
+                content_type='application/octet-stream' if is_compressed else 'text/plain'
             )
             
             print(f"Содержимое пасты {paste_id} сохранено в MinIO")
@@ -58,6 +135,61 @@ class MinioStorage:
             print(f"Ошибка сохранения в MinIO: {e}")
             raise
     
+    def save_paste_content_stream(self, paste_id: int, source) -> str:
+        """Сохраняет содержимое потоком и возвращает хеш
+        
+        source - файлоподобный объект, итератор порций bytes/str или строка.
+        Хеш и сжатие считаются по порциям; тело больше part_size загружается
+        multipart-загрузкой, поэтому память ограничена одной частью.
+        """
+        hasher = hashlib.sha256()
+        validator = codecs.getincrementaldecoder('utf-8')()
+        
+        def hashed():
+            for chunk in compression.iter_source(source):
+                hasher.update(chunk)
+                validator.decode(chunk)  # Паста должна быть корректным UTF-8
+                yield chunk
+            validator.decode(b'', final=True)
+        
+        object_name = f"{paste_id}/content.txt"
+        try:
+            self.client.put_object(
+                self.bucket_name,
+                object_name,
+                _ChunkReader(compression.iter_encoded(hashed(), self.codec, self.compress_min_bytes)),
+                length=-1,
+                part_size=self.part_size,
+                content_type='text/plain' if self.codec == 'none' else 'application/octet-stream'
+            )
+        except S3Error as e:
+            print(f"Ошибка потокового сохранения в MinIO: {e}")
+            raise
+        
+        print(f"Содержимое пасты {paste_id} сохранено в MinIO потоком")
+        return hasher.hexdigest()
+    
+    def iter_paste_content(self, paste_id: int, content_hash: str, chunk_size: int = 64 * 1024):
+        """Содержимое пасты порциями UTF-8 байтов (для потоковой отдачи) или None, если его нет
+        
+        Объект запрашивается сразу, поэтому ошибки всплывают до начала ответа.
+        Возвращаемый итератор нужно закрыть (werkzeug делает это сам).
+        """
+        object_name = f"{paste_id}/content.txt"
+        try:
+            response = self.client.get_object(self.bucket_name, object_name)
+        except S3Error as e:
+            if e.code == 'NoSuchKey':
+                return None
+            print(f"Ошибка чтения из MinIO для пасты {paste_id}: {e}")
+            raise
+        
+        def release():
+            response.close()
+            response.release_conn()
+        
+        return compression.DecodedStream(response, close=release, chunk_size=chunk_size)
+    
     def get_paste_content(self, paste_id: int, content_hash: str) -> str:
         """Получает содержимое пасты"""
         try:
@@ -66,7 +198,7 @@ class MinioStorage:
             
             # Скачиваем объект
             response = self.client.get_object(self.bucket_name, object_name)
-            content = response.read().decode('utf-8')
+            content = compression.decode(response.read())
             
             # Закрываем соединение
             response.close()
@@ -82,6 +214,61 @@ class MinioStorage:
             print(f"Неожиданная ошибка при загрузке пасты {paste_id}: {e}")
             raise
     
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Пул потоков создается в каждом процессе заново (потоки не переживают fork)
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='minio-io')
+                self._executor_pid = os.getpid()
+            return self._executor
+    
+    def get_paste_contents(self, items: list) -> dict:
+        """Получает содержимое нескольких паст параллельно: [(paste_id, content_hash)] -> {paste_id: content}
+        
+        Пасты, которые не удалось прочитать, в результат не попадают.
+        """
+        if not items:
+            return {}
+        
+        futures = {
+            paste_id: self._get_executor().submit(self.get_paste_content, paste_id, content_hash)
+            for paste_id, content_hash in items
+        }
+        
+        contents = {}
+        for paste_id, future in futures.items():
+            try:
+                contents[paste_id] = future.result()
+            except Exception as e:
+                print(f"Ошибка при загрузке пасты {paste_id} из MinIO: {e}")
+        return contents
+    
+    def delete_paste_files(self, items: list) -> dict:
+        """Удаляет содержимое и метаданные паст пакетно (remove_objects, до 1000 объектов на запрос)
+        
+        items - [(paste_id, content_hash)]. Возвращает {paste_id: ошибка} для паст,
+        содержимое которых удалить не удалось (ошибки метаданных не критичны).
+        """
+        objects = []
+        for paste_id, _ in items:
+            objects.append(DeleteObject(f"{paste_id}/content.txt"))
+            objects.append(DeleteObject(f"{paste_id}/metadata.json"))
+        
+        failed = {}
+        try:
+            # remove_objects ленивый: запросы выполняются при переборе ошибок
+            for error in self.client.remove_objects(self.bucket_name, objects):
+                if error.name.endswith('/content.txt'):
+                    failed[int(error.name.split('/', 1)[0])] = error.message
+                else:
+                    print(f"Ошибка удаления метаданных {error.name}: {error.message}")
+        except S3Error as e:
+            print(f"Ошибка пакетного удаления из MinIO: {e}")
+            return {paste_id: str(e) for paste_id, _ in items}
+        
+        print(f"Пакетно удалены файлы {len(items) - len(failed)} паст из MinIO")
+        return failed
+    
     def delete_paste_content(self, paste_id: int, content_hash: str):
         """Удаляет содержимое пасты"""
         try:
@@ -96,55 +283,6 @@ class MinioStorage:
             print(f"Ошибка удаления из MinIO: {e}")
             raise
     
-    def save_paste_metadata(self, paste_id: int, metadata: dict):
-        """Сохраняет метаданные пасты"""
-        try:
-            object_name = f"{paste_id}/metadata.json"
-            
-            # Преобразуем в JSON
-            metadata_json = json.dumps(metadata, ensure_ascii=False, indent=2)
-            
-            # Создаем BytesIO объект для MinIO
-            metadata_bytes = metadata_json.encode('utf-8')
-            metadata_stream = io.BytesIO(metadata_bytes)
-            
-            # Загружаем метаданные
-            self.client.put_object(
-                self.bucket_name,
-                object_name,
-                metadata_stream,
-                length=len(metadata_bytes),
-                content_type='application/json'
-            )
-            
-            print(f"Метаданные пасты {paste_id} сохранены в MinIO")
-            
-        except S3Error as e:
-            print(f"Ошибка сохранения метаданных: {e}")
-            raise
-    
-    def get_paste_metadata(self, paste_id: int) -> dict:
-        """Получает метаданные пасты"""
-        try:
-            object_name = f"{paste_id}/metadata.json"
-            
-            # Скачиваем объект
-            response = self.client.get_object(self.bucket_name, object_name)
-            metadata_json = response.read().decode('utf-8')
-            
-            # Закрываем соединение
-            response.close()
-            response.release_conn()
-            
-            # Парсим JSON
-            metadata = json.loads(metadata_json)
-            print(f"Метаданные пасты {paste_id} загружены из MinIO")
-            return metadata
-            
-        except S3Error as e:
-            print(f"Ошибка чтения метаданных: {e}")
-            return {}
-    
     def list_paste_files(self, paste_id: int) -> list:
         """Список файлов пасты"""
         try:
@@ -196,7 +334,7 @@ class MinioStorage:
             raise
 
     def delete_paste_metadata(self, paste_id: int):
-        """Удаляет метаданные пасты"""
+        """Удаляет объект метаданных пасты (его писали старые версии, метаданные теперь только в БД)"""
         try:
             object_name = f"{paste_id}/metadata.json"
             
@@ -224,3 +362,107 @@ class MinioStorage:
                 'size': 0,
                 'last_modified': None
             }
+
+    def recompress_objects(self, limit: int = None, start_after: str = None) -> dict:
+        """Пересжимает объекты содержимого, сохраненные без сжатия или другим кодеком
+
+        Объекты перечисляются по имени начиная после start_after; result['cursor'] -
+        последний просмотренный объект для следующего вызова (None - обход завершен).
+        Кодек определяется по заголовку (запрос первых байтов), целиком скачиваются
+        только объекты, которые нужно пересжать; limit ограничивает число таких загрузок.
+        """
+        result = {'files': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0, 'cursor': None}
+        if self.codec == 'none':
+            return result
+        
+        try:
+            for obj in self.client.list_objects(self.bucket_name, recursive=True, start_after=start_after):
+                if limit is not None and result['files'] + result['skipped'] >= limit:
+                    break
+                result['cursor'] = obj.object_name
+                if not obj.object_name.endswith('/content.txt') or obj.size < self.compress_min_bytes:
+                    continue
+                
+                try:
+                    response = self.client.get_object(self.bucket_name, obj.object_name,
+                                                      offset=0, length=compression.HEADER_SIZE)
+                    try:
+                        header = response.read()
+                    finally:
+                        response.close()
+                        response.release_conn()
+                    if compression.stored_codec(header) == self.codec:
+                        continue
+                    
+                    response = self.client.get_object(self.bucket_name, obj.object_name)
+                    try:
+                        data = response.read()
+                    finally:
+                        response.close()
+                        response.release_conn()
+                    
+                    encoded = compression.encode(compression.decode(data), self.codec, self.compress_min_bytes)
+                    if len(encoded) >= len(data):
+                        result['skipped'] += 1
+                        continue
+                    
+                    # Объект удален или перезаписан, пока шло пересжатие - не воскрешаем его
+                    if self.client.stat_object(self.bucket_name, obj.object_name).etag != obj.etag:
+                        continue
+                    
+                    self.client.put_object(
+                        self.bucket_name,
+                        obj.object_name,
+                        io.BytesIO(encoded),
+                        length=len(encoded),
+                        content_type='application/octet-stream'
+                    )
+                except S3Error as e:
+                    if e.code != 'NoSuchKey':
+                        raise
+                    continue
+                result['files'] += 1
+                result['bytes_before'] += len(data)
+                result['bytes_after'] += len(encoded)
+            else:
+                result['cursor'] = None
+        except S3Error as e:
+            print(f"Ошибка пересжатия объектов: {e}")
+        
+        return result
+        
+        try:
+            for obj in self.client.list_objects(self.bucket_name, recursive=True):
+                if limit is not None and result['files'] >= limit:
+                    break
+                if not obj.object_name.endswith('/content.txt') or obj.size < self.compress_min_bytes:
+                    continue
+                
+                response = self.client.get_object(self.bucket_name, obj.object_name)
+                try:
+                    data = response.read()
+                finally:
+                    response.close()
+                    response.release_conn()
+                
+                if compression.stored_codec(data) == self.codec:
+                    continue
+                
+                encoded = compression.encode(compression.decode(data), self.codec, self.compress_min_bytes)
+                if len(encoded) >= len(data):
+                    continue
+                
+                self.client.put_object(
+                    self.bucket_name,
+                    obj.object_name,
+                    io.BytesIO(encoded),
+                    length=len(encoded),
+                    content_type='application/octet-stream'
+                )
+                result['files'] += 1
+                result['bytes_before'] += len(data)
+                result['bytes_after'] += len(encoded)
+        except S3Error as e:
+            print(f"Ошибка пересжатия объектов: {e}")
+        
+        return result
@@ -1,84 +1,305 @@
+import codecs
 import os
 import hashlib
-import json
+import uuid
 from datetime import datetime
 
+import compression
+
 class FileStorage:
-    def __init__(self, upload_folder='uploads'):
+    def __init__(self, upload_folder='uploads', dedup=True, codec='auto',
+                 compress_min_bytes=compression.DEFAULT_MIN_BYTES):
         self.upload_folder = upload_folder
+        # Сжатие содержимого (zstd/gzip); кодек записывается в заголовок файла
+        self.codec = compression.resolve_codec(codec)
+        self.compress_min_bytes = compress_min_bytes
+        # Режим дедупликации: одинаковое содержимое хранится один раз в blobs/<hash>.txt,
+        # а файлы паст - жесткие ссылки на него. Счетчик ссылок inode = число паст с этим hash.
+        self.dedup = dedup
+        self.blobs_folder = os.path.join(upload_folder, 'blobs')
+        # Хеши blob, которые recompress_files уже пробовал и не смог сжать выгодно
+        self._incompressible_blobs = set()
         os.makedirs(upload_folder, exist_ok=True)
-    
+        if dedup:
+            os.makedirs(self.blobs_folder, exist_ok=True)
+
+    # Раскладка на диске: два уровня каталогов по hex-префиксу (uploads/ab/cd/...),
+    # т.е. до 65536 небольших каталогов вместо одного плоского uploads/.
+    # Файлы паст раскладываются по md5(paste_id), blob - по content_hash.
+    # Старые файлы в плоском uploads/ продолжают читаться и удаляться,
+    # пока migrate_to_sharded_layout() не перенесет их.
+
+    @staticmethod
+    def _shard(key: str) -> tuple:
+        return key[0:2], key[2:4]
+
+    def _paste_dir(self, paste_id: int) -> str:
+        digest = hashlib.md5(str(paste_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.upload_folder, *self._shard(digest))
+
+    def _paste_path(self, paste_id: int, filename: str) -> str:
+        return os.path.join(self._paste_dir(paste_id), filename)
+
+    def _legacy_path(self, filename: str) -> str:
+        return os.path.join(self.upload_folder, filename)
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.blobs_folder, *self._shard(content_hash), f"{content_hash}.txt")
+
+    def _legacy_blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.blobs_folder, f"{content_hash}.txt")
+
+    def _open_existing(self, paths: list, mode='rb'):
+        """Открывает первый существующий файл из списка путей
+
+        Проверяем новый путь повторно: файл мог быть перенесен миграцией
+        между проверками нового и старого путей.
+        """
+        for path in paths + paths[:1]:
+            try:
+                if 'b' in mode:
+                    return open(path, mode)
+                return open(path, mode, encoding='utf-8')
+            except FileNotFoundError:
+                continue
+        return None
+
     def save_paste_content(self, paste_id: int, content: str) -> str:
         """Сохраняет содержимое пасты в файл"""
         content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
         filename = f"{paste_id}_{content_hash}.txt"
-        filepath = os.path.join(self.upload_folder, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
+        paste_dir = self._paste_dir(paste_id)
+        filepath = os.path.join(paste_dir, filename)
+        os.makedirs(paste_dir, exist_ok=True)
+
+        if self.dedup and self._link_existing_blob(content_hash, filepath):
+            return content_hash
+
+        # Пишем во временный файл и атомарно публикуем его под именем пасты
+        tmp_path = os.path.join(paste_dir, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(compression.encode(content, self.codec, self.compress_min_bytes))
+
+        try:
+            os.replace(tmp_path, filepath)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        if self.dedup:
+            # Регистрируем blob для следующих паст с тем же содержимым
+            blob_path = self._blob_path(content_hash)
+            try:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.link(filepath, blob_path)
+            except FileExistsError:
+                pass  # Параллельный запрос уже создал blob
+            except OSError as e:
+                print(f"Не удалось создать blob {content_hash}: {e}")
+
         return content_hash
-    
+
+    def save_paste_content_stream(self, paste_id: int, source) -> str:
+        """Сохраняет содержимое потоком (файлоподобный объект или итератор порций) и возвращает хеш
+
+        Хеш и сжатие считаются по порциям, в память целиком содержимое не загружается.
+        """
+        hasher = hashlib.sha256()
+        validator = codecs.getincrementaldecoder('utf-8')()
+
+        def hashed():
+            for chunk in compression.iter_source(source):
+                hasher.update(chunk)
+                validator.decode(chunk)  # Паста должна быть корректным UTF-8
+                yield chunk
+            validator.decode(b'', final=True)
+
+        paste_dir = self._paste_dir(paste_id)
+        os.makedirs(paste_dir, exist_ok=True)
+        tmp_path = os.path.join(paste_dir, f".{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in compression.iter_encoded(hashed(), self.codec, self.compress_min_bytes):
+                    f.write(chunk)
+
+            # Имя файла зависит от хеша, поэтому публикуем файл только после записи
+            content_hash = hasher.hexdigest()
+            filepath = os.path.join(paste_dir, f"{paste_id}_{content_hash}.txt")
+            if self.dedup and self._link_existing_blob(content_hash, filepath):
+                return content_hash
+            os.replace(tmp_path, filepath)
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        if self.dedup:
+            blob_path = self._blob_path(content_hash)
+            try:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.link(filepath, blob_path)
+            except FileExistsError:
+                pass
+            except OSError as e:
+                print(f"Не удалось создать blob {content_hash}: {e}")
+
+        return content_hash
+
+    def _link_existing_blob(self, content_hash: str, filepath: str) -> bool:
+        """Создает файл пасты как жесткую ссылку на существующий blob (без записи данных)"""
+        for blob_path in (self._blob_path(content_hash), self._legacy_blob_path(content_hash)):
+            try:
+                os.link(blob_path, filepath)
+                return True
+            except FileExistsError:
+                # Файл пасты уже есть (повторное сохранение) - он и так ссылается на нужные данные
+                return True
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # ФС не поддерживает жесткие ссылки - пишем обычный файл
+                return False
+        return False
+
     def get_paste_content(self, paste_id: int, content_hash: str) -> str:
         """Получает содержимое пасты из файла"""
         filename = f"{paste_id}_{content_hash}.txt"
-        filepath = os.path.join(self.upload_folder, filename)
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
+        f = self._open_existing([self._paste_path(paste_id, filename), self._legacy_path(filename)])
+        if f is None:
             return None
-    
+
+        with f:
+            return compression.decode(f.read())
+
+    def iter_paste_content(self, paste_id: int, content_hash: str, chunk_size: int = 64 * 1024):
+        """Содержимое пасты порциями UTF-8 байтов (для потоковой отдачи) или None, если файла нет"""
+        filename = f"{paste_id}_{content_hash}.txt"
+        f = self._open_existing([self._paste_path(paste_id, filename), self._legacy_path(filename)])
+        if f is None:
+            return None
+        return compression.DecodedStream(f, chunk_size=chunk_size)
+
+    def get_paste_contents(self, items: list) -> dict:
+        """Содержимое нескольких паст: [(paste_id, content_hash)] -> {paste_id: content}"""
+        contents = {}
+        for paste_id, content_hash in items:
+            try:
+                content = self.get_paste_content(paste_id, content_hash)
+            except Exception as e:
+                print(f"Ошибка при загрузке пасты {paste_id}: {e}")
+                continue
+            if content is not None:
+                contents[paste_id] = content
+        return contents
+
+    def get_paste_content_path(self, paste_id: int, content_hash: str):
+        """Абсолютный путь к файлу содержимого (для отдачи через sendfile) или None"""
+        filename = f"{paste_id}_{content_hash}.txt"
+        paths = [self._paste_path(paste_id, filename), self._legacy_path(filename)]
+        for path in paths + paths[:1]:
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        return None
+
     def delete_paste_content(self, paste_id: int, content_hash: str):
-        """Удаляет файл пасты"""
+        """Удаляет файл пасты (и blob, если на него больше никто не ссылается)"""
         filename = f"{paste_id}_{content_hash}.txt"
-        filepath = os.path.join(self.upload_folder, filename)
-        
-        try:
-            os.remove(filepath)
-        except FileNotFoundError:
-            pass
-    
-    def save_paste_metadata(self, paste_id: int, metadata: dict):
-        """Сохраняет метаданные пасты"""
-        filename = f"{paste_id}_metadata.json"
-        filepath = os.path.join(self.upload_folder, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
-    
-    def get_paste_metadata(self, paste_id: int) -> dict:
-        """Получает метаданные пасты"""
-        filename = f"{paste_id}_metadata.json"
-        filepath = os.path.join(self.upload_folder, filename)
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-    
+
+        for filepath in (self._paste_path(paste_id, filename), self._legacy_path(filename)):
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+
+        if self.dedup:
+            self._release_blob(content_hash)
+
+    def delete_paste_files(self, items: list) -> dict:
+        """Удаляет содержимое и метаданные паст [(paste_id, content_hash)]; возвращает {paste_id: ошибка}"""
+        failed = {}
+        for paste_id, content_hash in items:
+            try:
+                self.delete_paste_content(paste_id, content_hash)
+            except Exception as e:
+                failed[paste_id] = str(e)
+                continue
+            try:
+                self.delete_paste_metadata(paste_id)
+            except Exception:
+                pass  # Метаданные не критичны
+        return failed
+
+    def _release_blob(self, content_hash: str):
+        """Удаляет blob, если осталась только ссылка из blobs/
+
+        Если параллельно создается паста с тем же hash и успевает сослаться на blob,
+        ее данные не теряются: файл пасты сам держит inode, удаляется только имя blob.
+        """
+        for blob_path in (self._blob_path(content_hash), self._legacy_blob_path(content_hash)):
+            try:
+                if os.stat(blob_path).st_nlink <= 1:
+                    os.remove(blob_path)
+            except FileNotFoundError:
+                pass
+
+    def _iter_blob_files(self):
+        """Обходит все blob-файлы (в шардированных каталогах и в старом плоском blobs/)"""
+        for root, dirs, files in os.walk(self.blobs_folder):
+            for filename in files:
+                yield os.path.join(root, filename)
+
+    def get_dedup_info(self) -> dict:
+        """Статистика дедупликации: сколько уникальных blob и сколько ссылок на них"""
+        blob_count = 0
+        blob_bytes = 0
+        references = 0
+        for blob_path in self._iter_blob_files():
+            try:
+                stat = os.stat(blob_path)
+            except FileNotFoundError:
+                continue
+            blob_count += 1
+            blob_bytes += stat.st_size
+            references += stat.st_nlink - 1
+
+        return {
+            'enabled': self.dedup,
+            'blobs': blob_count,
+            'blob_bytes': blob_bytes,
+            'references': references
+        }
+
     def delete_paste_metadata(self, paste_id: int):
-        """Удаляет метаданные пасты"""
+        """Удаляет файл метаданных пасты (их писали старые версии, метаданные теперь только в БД)"""
         filename = f"{paste_id}_metadata.json"
-        filepath = os.path.join(self.upload_folder, filename)
-        
-        try:
-            os.remove(filepath)
-        except FileNotFoundError:
-            pass
-    
+
+        for filepath in (self._paste_path(paste_id, filename), self._legacy_path(filename)):
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+
     def list_paste_files(self, paste_id: int) -> list:
-        """Список файлов пасты"""
+        """Список файлов пасты (читается только каталог-шард этой пасты)"""
         try:
             files = []
-            for filename in os.listdir(self.upload_folder):
-                if filename.startswith(f"{paste_id}_"):
-                    filepath = os.path.join(self.upload_folder, filename)
-                    stat = os.stat(filepath)
+            prefix = f"{paste_id}_"
+            paste_dir = self._paste_dir(paste_id)
+
+            try:
+                entries = list(os.scandir(paste_dir))
+            except FileNotFoundError:
+                entries = []
+
+            for entry in entries:
+                if entry.name.startswith(prefix) and entry.is_file():
+                    stat = entry.stat()
                     files.append({
-                        'name': filename,
+                        'name': entry.name,
                         'size': stat.st_size,
                         'last_modified': datetime.fromtimestamp(stat.st_mtime)
                     })
@@ -86,18 +307,28 @@ class FileStorage:
         except Exception as e:
             print(f"Ошибка получения списка файлов: {e}")
             return []
-    
+
     def get_bucket_info(self) -> dict:
         """Получает информацию о хранилище"""
         try:
             total_size = 0
             file_count = 0
-            for filename in os.listdir(self.upload_folder):
-                filepath = os.path.join(self.upload_folder, filename)
-                if os.path.isfile(filepath):
-                    total_size += os.path.getsize(filepath)
+            seen_inodes = set()
+            for root, dirs, files in os.walk(self.upload_folder):
+                # blob - дополнительные ссылки на файлы паст, отдельно не считаем
+                if root == self.upload_folder and 'blobs' in dirs:
+                    dirs.remove('blobs')
+                for filename in files:
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except FileNotFoundError:
+                        continue
                     file_count += 1
-            
+                    # Жесткие ссылки на один blob занимают место на диске один раз
+                    if (stat.st_dev, stat.st_ino) not in seen_inodes:
+                        seen_inodes.add((stat.st_dev, stat.st_ino))
+                        total_size += stat.st_size
+
             return {
                 'bucket_name': self.upload_folder,
                 'size': total_size,
@@ -112,3 +343,246 @@ class FileStorage:
                 'last_modified': None
             }
 
+    def migrate_to_sharded_layout(self, limit: int = None) -> int:
+        """Переносит файлы из плоского uploads/ (и blobs/) в шардированные каталоги
+
+        Можно запускать на работающем приложении: перенос - атомарный rename
+        в пределах одной ФС (жесткие ссылки сохраняются), а чтение и удаление
+        проверяют оба расположения. Возвращает число перенесенных файлов.
+        """
+        moved_count = 0
+
+        with os.scandir(self.upload_folder) as entries:
+            for entry in entries:
+                if limit is not None and moved_count >= limit:
+                    return moved_count
+                if not entry.is_file() or entry.name.startswith('.'):
+                    continue
+
+                paste_id, separator, _ = entry.name.partition('_')
+                if not separator or not paste_id.isdigit():
+                    continue
+
+                target_path = self._paste_path(int(paste_id), entry.name)
+                if self._move_file(entry.path, target_path):
+                    moved_count += 1
+
+        if os.path.isdir(self.blobs_folder):
+            with os.scandir(self.blobs_folder) as entries:
+                for entry in entries:
+                    if limit is not None and moved_count >= limit:
+                        return moved_count
+                    if not entry.is_file() or not entry.name.endswith('.txt'):
+                        continue
+
+                    content_hash = entry.name[:-len('.txt')]
+                    if self._move_file(entry.path, self._blob_path(content_hash)):
+                        moved_count += 1
+
+        return moved_count
+
+    @staticmethod
+    def _move_file(source_path: str, target_path: str) -> bool:
+        """Атомарно переносит файл, не перезаписывая уже существующий"""
+        try:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            if os.path.exists(target_path):
+                # Файл уже записан в новом месте - старая копия не нужна
+                os.remove(source_path)
+                return False
+            os.replace(source_path, target_path)
+            return True
+        except FileNotFoundError:
+            # Файл удален параллельно (истечение пасты)
+            return False
+        except OSError as e:
+            print(f"Ошибка переноса {source_path}: {e}")
+            return False
+
+    def _iter_content_files(self, start_after: tuple = ()):
+        """Файлы содержимого в порядке путей: (части пути относительно upload_folder, путь)
+
+        Обход начинается после start_after: каталоги, целиком лежащие до него,
+        не читаются, поэтому продолжение обхода не стоит повторного прохода по дереву.
+        """
+        def walk(directory, prefix):
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                parts = prefix + (entry.name,)
+                if parts < start_after[:len(parts)]:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk(entry.path, parts)
+                elif parts > start_after and entry.name.endswith('.txt') and not entry.name.startswith('.'):
+                    yield parts, entry.path
+
+        yield from walk(self.upload_folder, ())
+
+    @staticmethod
+    def _replace_if_unchanged(source_path: str, path: str, stat) -> bool:
+        """Атомарно заменяет path жесткой ссылкой на source_path, если path - все тот же inode
+
+        Проверка выполняется непосредственно перед заменой: файл, удаленный
+        параллельно (истечение пасты), не воскрешается.
+        """
+        link_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+        os.link(source_path, link_path)
+        try:
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                return False
+            if (current.st_dev, current.st_ino) != (stat.st_dev, stat.st_ino):
+                return False
+            os.replace(link_path, path)
+            return True
+        finally:
+            try:
+                os.remove(link_path)
+            except FileNotFoundError:
+                pass
+
+    def _recompress_file(self, path: str, stat, result: dict) -> bool:
+        """Пересжимает один файл; False - если сжатие невыгодно или файл удален"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        encoded = compression.encode(compression.decode(data), self.codec, self.compress_min_bytes)
+        if len(encoded) >= len(data):
+            result['skipped'] += 1
+            return False
+
+        tmp_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(encoded)
+            if not self._replace_if_unchanged(tmp_path, path, stat):
+                return False
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        result['files'] += 1
+        result['bytes_before'] += len(data)
+        result['bytes_after'] += len(encoded)
+        return True
+
+    def recompress_files(self, limit: int = None, start_after: str = None) -> dict:
+        """Пересжимает файлы паст, сохраненные без сжатия или другим кодеком
+
+        Фоновая задача для старых данных, выполняется порциями. Файлы обходятся
+        в порядке путей; result['cursor'] - последний просмотренный путь, следующий
+        вызов с start_after=cursor продолжает с него (None - обход завершен).
+        limit ограничивает число файлов, прочитанных целиком.
+
+        Файлы паст, для содержимого которых есть blob, пересжимаются через него:
+        blob заменяется сжатым файлом один раз, файлы паст при обходе
+        перевешиваются на него без чтения, так что дедупликация сохраняется.
+        Несжимаемые blob запоминаются и повторно не читаются.
+        """
+        result = {'files': 0, 'linked': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0, 'cursor': None}
+        if self.codec == 'none':
+            return result
+
+        last_parts = None
+        for parts, path in self._iter_content_files(tuple(start_after.split('/')) if start_after else ()):
+            if limit is not None and last_parts is not None and result['files'] + result['skipped'] >= limit:
+                result['cursor'] = '/'.join(last_parts)
+                break
+            last_parts = parts
+            try:
+                stat = os.stat(path)
+                with open(path, 'rb') as f:
+                    header = f.read(compression.HEADER_SIZE)
+                if compression.stored_codec(header) == self.codec or stat.st_size < self.compress_min_bytes:
+                    continue
+
+                content_hash = parts[-1][:-len('.txt')].rsplit('_', 1)[-1]
+                blob_path = None
+                if self.dedup and parts[0] != 'blobs':
+                    blob_path = next((candidate for candidate in (self._blob_path(content_hash),
+                                                                  self._legacy_blob_path(content_hash))
+                                      if os.path.exists(candidate)), None)
+                if blob_path is None:
+                    self._recompress_file(path, stat, result)
+                    continue
+
+                if content_hash in self._incompressible_blobs:
+                    continue
+                blob_stat = os.stat(blob_path)
+                with open(blob_path, 'rb') as f:
+                    blob_codec = compression.stored_codec(f.read(compression.HEADER_SIZE))
+                # Blob еще не пересжат - пересжимаем его, затем перевешиваем на него эту ссылку
+                if blob_codec != self.codec:
+                    skipped = result['skipped']
+                    if not self._recompress_file(blob_path, blob_stat, result):
+                        if result['skipped'] > skipped:
+                            self._incompressible_blobs.add(content_hash)
+                        continue
+                if self._replace_if_unchanged(blob_path, path, stat):
+                    result['linked'] += 1
+            except FileNotFoundError:
+                continue  # Паста удалена параллельно
+            except Exception as e:
+                print(f"Ошибка пересжатия {path}: {e}")
+
+        return result
+
+        # Собираем группы путей по inode среди файлов, требующих пересжатия
+        groups = {}
+        for root, dirs, files in os.walk(self.upload_folder):
+            for filename in files:
+                if not filename.endswith('.txt') or filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                    with open(path, 'rb') as f:
+                        header = f.read(compression.HEADER_SIZE)
+                except FileNotFoundError:
+                    continue
+                if compression.stored_codec(header) == self.codec:
+                    continue
+                if stat.st_size < self.compress_min_bytes:
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                groups.setdefault(key, []).append(path)
+
+        for (dev, ino), paths in groups.items():
+            if limit is not None and result['files'] >= limit:
+                break
+            try:
+                with open(paths[0], 'rb') as f:
+                    data = f.read()
+                encoded = compression.encode(compression.decode(data), self.codec, self.compress_min_bytes)
+                if len(encoded) >= len(data):
+                    continue
+
+                tmp_path = os.path.join(os.path.dirname(paths[0]), f".{uuid.uuid4().hex}.tmp")
+                with open(tmp_path, 'wb') as f:
+                    f.write(encoded)
+
+                for path in paths:
+                    try:
+                        current = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # Паста удалена, пока шло пересжатие - не воскрешаем файл
+                    if (current.st_dev, current.st_ino) != (dev, ino):
+                        continue
+                    link_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+                    os.link(tmp_path, link_path)
+                    os.replace(link_path, path)
+
+                os.remove(tmp_path)
+                result['files'] += 1
+                result['bytes_before'] += len(data)
+                result['bytes_after'] += len(encoded)
+            except Exception as e:
+                print(f"Ошибка пересжатия {paths[0]}: {e}")
+
+        return result
@@ -0,0 +1,347 @@
+import hashlib
+import os
+import threading
+import uuid
+
+import compression
+
+
+class _LocalCopy:
+    """Локальная копия, которая пишется порциями по мере передачи содержимого
+
+    Данные идут во временный файл и публикуются в кэше только после publish().
+    Если содержимое больше восьмой части кэша, копия отбрасывается, как и в _store_local.
+    """
+
+    def __init__(self, storage, paste_id: int):
+        self.storage = storage
+        self.paste_id = paste_id
+        self.limit = storage.max_bytes // 8
+        self.size = 0
+        self.temp_path = os.path.join(storage.cache_dir, f"{uuid.uuid4().hex}.tmp")
+        self.file = None
+        if self.limit > 0:
+            try:
+                self.file = open(self.temp_path, 'wb')
+            except OSError as e:
+                print(f"Не удалось записать пасту {paste_id} в локальный кэш: {e}")
+
+    def write(self, chunk: bytes):
+        if self.file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.limit:
+            self.discard()
+            return
+        try:
+            self.file.write(chunk)
+        except OSError as e:
+            print(f"Не удалось записать пасту {self.paste_id} в локальный кэш: {e}")
+            self.discard()
+
+    def discard(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, content_hash: str):
+        """Публикует копию под ключом (paste_id, content_hash); возвращает путь или None"""
+        if self.file is None:
+            return None
+        self.file.close()
+        self.file = None
+        try:
+            path = self.storage._cache_path(self.paste_id, content_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.temp_path, path)
+        except OSError as e:
+            print(f"Не удалось записать пасту {self.paste_id} в локальный кэш: {e}")
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+            return None
+        self.storage._add_bytes(self.size)
+        return path
+
+
+class _CachingStream:
+    """Поток содержимого из MinIO, попутно заполняющий локальную копию
+
+    Копия публикуется, только если поток дочитан до конца; при обрыве
+    соединения (close() до конца перебора) она отбрасывается.
+    """
+
+    def __init__(self, stream, local_copy: _LocalCopy, content_hash: str):
+        self._stream = stream
+        self._local = local_copy
+        self._content_hash = content_hash
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._stream)
+        except StopIteration:
+            self._local.publish(self._content_hash)
+            raise
+        self._local.write(chunk)
+        return chunk
+
+    def close(self):
+        self._local.discard()
+        self._stream.close()
+
+
+class TieredStorage:
+    """Локальный дисковый кэш содержимого паст перед MinioStorage
+
+    MinIO остается источником истины: сохранение пишет сначала в MinIO, затем
+    в локальный кэш (write-through), чтение идет из кэша и только при промахе -
+    в MinIO. Файл кэша - это UTF-8 текст пасты, поэтому его можно отдавать
+    напрямую (get_paste_content_path, sendfile).
+
+    Размер кэша ограничен max_bytes; вытесняются файлы, к которым дольше всего
+    не обращались (время последнего обращения - mtime, обновляется при чтении).
+    Каталог кэша может быть общим для нескольких воркеров одной машины.
+
+    Согласованность между репликами: ключ файла - (paste_id, content_hash), а
+    содержимое пасты неизменно. Читают пасту только после проверки строки в БД,
+    поэтому удаленная на другой реплике паста из локального кэша не отдается,
+    а ее файл освобождается вытеснением. Локальный файл удаляется сразу на той
+    реплике, которая выполняет удаление.
+    """
+
+    def __init__(self, remote, cache_dir: str = 'cache/pastes', max_bytes: int = 1024 * 1024 * 1024):
+        self.remote = remote
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.current_bytes = self._scan()[1]
+
+    def __getattr__(self, name):
+        # Метаданные и прочие операции - напрямую в MinIO
+        return getattr(self.remote, name)
+
+    def _cache_path(self, paste_id: int, content_hash: str) -> str:
+        shard = hashlib.md5(str(paste_id).encode('utf-8')).hexdigest()[:2]
+        return os.path.join(self.cache_dir, shard, f"{paste_id}_{content_hash}.txt")
+
+    def _scan(self) -> tuple:
+        """Файлы кэша [(mtime, size, path)] и их суммарный размер"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        """Удаляет давно не читавшиеся файлы, пока кэш не займет 90% лимита"""
+        entries, total = self._scan()
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except FileNotFoundError:
+                total -= size
+        self.current_bytes = total
+
+    def _store_local(self, paste_id: int, content_hash: str, content: str):
+        data = content.encode('utf-8')
+        # Пасты больше восьмой части кэша не кэшируем, чтобы не вытеснять все остальное
+        if self.max_bytes <= 0 or len(data) > self.max_bytes // 8:
+            return None
+
+        path = self._cache_path(paste_id, content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        self._add_bytes(len(data))
+        return path
+
+    def _add_bytes(self, size: int):
+        with self._lock:
+            self.current_bytes += size
+            if self.current_bytes > self.max_bytes:
+                self._evict()
+
+    def _touch(self, path: str) -> bool:
+        """Отмечает обращение к файлу кэша; False - файла нет (вытеснен)"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def save_paste_content(self, paste_id: int, content: str) -> str:
+        """Сохраняет содержимое в MinIO и в локальный кэш"""
+        content_hash = self.remote.save_paste_content(paste_id, content)
+        try:
+            self._store_local(paste_id, content_hash, content)
+        except OSError as e:
+            print(f"Не удалось записать пасту {paste_id} в локальный кэш: {e}")
+        return content_hash
+
+    def save_paste_content_stream(self, paste_id: int, source) -> str:
+        """Сохраняет содержимое потоком в MinIO, попутно записывая локальную копию
+
+        Копия пишется во временный файл по мере загрузки и публикуется после того,
+        как MinIO вернул хеш. Если содержимое больше восьмой части кэша, копия
+        отбрасывается, как и в _store_local.
+        """
+        local_copy = _LocalCopy(self, paste_id)
+
+        def tee():
+            for chunk in compression.iter_source(source):
+                local_copy.write(chunk)
+                yield chunk
+
+        try:
+            content_hash = self.remote.save_paste_content_stream(paste_id, tee())
+        except Exception:
+            local_copy.discard()
+            raise
+
+        local_copy.publish(content_hash)
+        return content_hash
+
+    def get_paste_content(self, paste_id: int, content_hash: str) -> str:
+        """Получает содержимое из локального кэша или из MinIO"""
+        path = self._cache_path(paste_id, content_hash)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read().decode('utf-8')
+            self._touch(path)
+            self.hits += 1
+            return content
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        content = self.remote.get_paste_content(paste_id, content_hash)
+        if content is not None:
+            try:
+                self._store_local(paste_id, content_hash, content)
+            except OSError as e:
+                print(f"Не удалось записать пасту {paste_id} в локальный кэш: {e}")
+        return content
+
+    def get_paste_contents(self, items: list) -> dict:
+        """Содержимое нескольких паст: локальные копии, остальные - параллельно из MinIO"""
+        contents = {}
+        missing = []
+        for paste_id, content_hash in items:
+            path = self._cache_path(paste_id, content_hash)
+            try:
+                with open(path, 'rb') as f:
+                    contents[paste_id] = f.read().decode('utf-8')
+                self._touch(path)
+                self.hits += 1
+            except FileNotFoundError:
+                missing.append((paste_id, content_hash))
+
+        if missing:
+            self.misses += len(missing)
+            loaded = self.remote.get_paste_contents(missing)
+            for paste_id, content_hash in missing:
+                content = loaded.get(paste_id)
+                if content is None:
+                    continue
+                contents[paste_id] = content
+                try:
+                    self._store_local(paste_id, content_hash, content)
+                except OSError as e:
+                    print(f"Не удалось записать пасту {paste_id} в локальный кэш: {e}")
+        return contents
+
+    def iter_paste_content(self, paste_id: int, content_hash: str, chunk_size: int = 64 * 1024):
+        """Содержимое порциями: из локальной копии, при промахе - потоком из MinIO
+
+        При промахе порции попутно пишутся в локальную копию, так что следующий
+        запрос получит путь для sendfile; память ограничена порцией.
+        """
+        path = self._cache_path(paste_id, content_hash)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            stream = self.remote.iter_paste_content(paste_id, content_hash, chunk_size)
+            if stream is None:
+                return None
+            return _CachingStream(stream, _LocalCopy(self, paste_id), content_hash)
+        self._touch(path)
+        self.hits += 1
+        return compression.DecodedStream(f, chunk_size=chunk_size)
+
+    def get_paste_content_path(self, paste_id: int, content_hash: str):
+        """Путь к локальной копии содержимого или None при промахе
+
+        Из MinIO здесь ничего не загружается: при промахе содержимое отдается
+        потоком (iter_paste_content), который заодно заполняет локальную копию.
+        """
+        path = self._cache_path(paste_id, content_hash)
+        if self._touch(path):
+            self.hits += 1
+            return os.path.abspath(path)
+        return None
+
+    def delete_paste_content(self, paste_id: int, content_hash: str):
+        """Удаляет содержимое из локального кэша и из MinIO"""
+        self._remove_local(paste_id, content_hash)
+        return self.remote.delete_paste_content(paste_id, content_hash)
+
+    def _remove_local(self, paste_id: int, content_hash: str):
+        path = self._cache_path(paste_id, content_hash)
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+            with self._lock:
+                self.current_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def delete_paste_files(self, items: list) -> dict:
+        """Пакетно удаляет содержимое и метаданные паст: локальные копии и объекты MinIO"""
+        for paste_id, content_hash in items:
+            self._remove_local(paste_id, content_hash)
+        return self.remote.delete_paste_files(items)
+
+    def get_tier_stats(self) -> dict:
+        """Счетчики локального кэша текущего процесса"""
+        lookups = self.hits + self.misses
+        return {
+            'pid': os.getpid(),
+            'cache_dir': self.cache_dir,
+            'current_bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,113 @@
+import atexit
+import os
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db
+
+
+class ViewCounter:
+    """Буферизованный счетчик просмотров (write-behind)
+
+    Просмотры копятся в памяти воркера и записываются в БД одним
+    UPDATE ... FROM (VALUES ...) раз в flush_interval секунд, при накоплении
+    max_pending просмотров и при остановке процесса.
+
+    Возможные потери: при аварийном завершении воркера (SIGKILL, OOM) теряются
+    просмотры, накопленные с последней записи, - не больше max_pending и не дольше
+    flush_interval секунд. При ошибке БД накопленные значения возвращаются в буфер.
+    """
+
+    def __init__(self, app, flush_interval: float = 5.0, max_pending: int = 100):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        """Запускает поток записи в текущем процессе (после fork воркера gunicorn)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def record(self, paste_id: int, count: int = 1):
+        """Учитывает просмотр пасты"""
+        self._ensure_thread()
+        with self._lock:
+            self._pending[paste_id] = self._pending.get(paste_id, 0) + count
+            self._pending_total += count
+            should_flush = self._pending_total >= self.max_pending
+        if should_flush:
+            self._wakeup.set()
+
+    def pending_views(self, paste_id: int) -> int:
+        """Просмотры пасты, еще не записанные в БД этим воркером"""
+        with self._lock:
+            return self._pending.get(paste_id, 0)
+
+    def apply_pending(self, paste):
+        """Показывает пасту с учетом незаписанных просмотров (read-your-views)
+
+        Значение выставляется как уже сохраненное, поэтому ORM не запишет его в БД
+        и оно не задвоится при следующей записи буфера.
+        """
+        pending = self.pending_views(paste.id)
+        if pending:
+            set_committed_value(paste, 'views_count', (paste.views_count or 0) + pending)
+
+    def flush(self) -> int:
+        """Записывает накопленные просмотры в БД одним запросом"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+                self._pending_total = 0
+
+            values = []
+            params = {}
+            for index, (paste_id, delta) in enumerate(batch.items()):
+                values.append(f"(:id{index}, :delta{index})")
+                params[f"id{index}"] = paste_id
+                params[f"delta{index}"] = delta
+
+            statement = text(
+                "UPDATE pastes SET views_count = COALESCE(pastes.views_count, 0) + v.delta "
+                f"FROM (VALUES {', '.join(values)}) AS v(id, delta) "
+                "WHERE pastes.id = v.id"
+            )
+
+            try:
+                with self.app.app_context():
+                    db.session.execute(statement, params)
+                    db.session.commit()
+                return len(batch)
+            except Exception as e:
+                print(f"Ошибка записи счетчиков просмотров: {e}")
+                # Возвращаем просмотры в буфер, чтобы записать их в следующий раз
+                with self._lock:
+                    for paste_id, delta in batch.items():
+                        self._pending[paste_id] = self._pending.get(paste_id, 0) + delta
+                        self._pending_total += delta
+                return 0